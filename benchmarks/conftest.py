@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+RESULTS = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--bench-json", metavar="PATH", help="Write benchmark results to this JSON file")
+
+
+def pytest_configure(config):
+    config.stash[RESULTS] = []
+
+
+@pytest.fixture
+def bench_results(pytestconfig):
+    return pytestconfig.stash[RESULTS]
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash.get(RESULTS, [])
+    if not results:
+        return
+    terminalreporter.section("fetch benchmarks")
+    terminalreporter.write_line(f"{'scenario':<12}{'rows':>10}{'seconds':>10}{'requests/s':>12}{'rows/s':>12}{'peak RSS MB':>13}")
+    for result in results:
+        terminalreporter.write_line(
+            f"{result['scenario']:<12}{result['rows']:>10}{result['seconds']:>10.2f}"
+            f"{result['requests_per_second']:>12.1f}{result['rows_per_second']:>12,.0f}{result['peak_rss_mb']:>13.1f}"
+        )
+    path = config.getoption("--bench-json")
+    if path:
+        with open(path, "w") as fp:
+            json.dump(results, fp, indent=2)
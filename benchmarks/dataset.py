@@ -0,0 +1,234 @@
+"""Deterministic synthetic Toggl data for load testing.
+
+:class:`TogglDataset` produces workspaces, projects and time entries shaped
+like Toggl API v9 responses: tags arrays, nested objects, nulls, a running
+entry and columns that only appear part-way through the data, as the API
+gains fields over time. Every record is derived from the seed and its
+index alone, so any slice of a multi-million row dataset can be produced
+on demand, identically each time, without generating what comes before it.
+
+Write a dataset straight into a database with::
+
+    python benchmarks/dataset.py toggl.db --entries 1000000 --seed 1
+
+The data ends on :data:`DEFAULT_END` unless another ``end`` is given, so a
+seed gives the same data whatever day it is generated on.
+"""
+
+import argparse
+import datetime
+import hashlib
+import time
+from typing import Iterator
+
+import sqlite_utils
+
+from toggl_to_sqlite.utils import save_items
+
+MASK = 2**64 - 1
+WORDS = (
+    "review planning email standup design research support deploy meeting interview "
+    "refactor testing docs invoice onboarding migration triage analytics roadmap sync"
+).split()
+TAGS = ("billable", "internal", "urgent", "meeting", "deep-work", "admin", "travel", "training", "bug", "client")
+COLORS = ("#0b83d9", "#9e5bd9", "#d94182", "#e36a00", "#bf7000", "#2da608", "#06a893", "#c9806b")
+# Columns the API started returning part-way through the data: (fraction of entries before they appear, column)
+EVOLVING_COLUMNS = (
+    (0.25, "tag_ids"),
+    (0.5, "expense_ids"),
+    (0.75, "permissions"),
+)
+# The last day of data unless another end is given; fixed so a seed always gives the same timestamps
+DEFAULT_END = datetime.date(2024, 12, 31)
+
+
+def _at(moment: datetime.datetime) -> str:
+    """Format a naive UTC datetime the way Toggl does, e.g. ``2023-01-01T09:30:00+00:00``."""
+    return moment.isoformat() + "+00:00"
+
+
+def _mix(*values: int) -> int:
+    """splitmix64 over ``values``: a fast, well-distributed hash for per-record randomness."""
+    state = 0
+    for value in values:
+        state = (state + value + 0x9E3779B97F4A7C15) & MASK
+        state = ((state ^ (state >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+        state = ((state ^ (state >> 27)) * 0x94D049BB133111EB) & MASK
+        state ^= state >> 31
+    return state
+
+
+class TogglDataset:
+    """A reproducible Toggl account of ``entries`` time entries spread over ``days`` days.
+
+    Entries are evenly spaced in time and ordered by index, so the entries
+    in any date range are a contiguous slice (see :meth:`index_range`).
+    """
+
+    def __init__(
+        self,
+        entries: int = 10_000,
+        days: int = 365,
+        seed: int = 0,
+        workspaces: int = 2,
+        projects: int = 50,
+        clients: int = 10,
+        users: int = 5,
+        end: datetime.date = None,
+    ) -> None:
+        self.entries = entries
+        self.days = days
+        self.seed = seed
+        self.workspace_count = workspaces
+        self.project_count = projects
+        self.client_count = clients
+        self.user_count = users
+        end = end or DEFAULT_END
+        self.start = datetime.datetime.combine(end - datetime.timedelta(days=days), datetime.time())
+        self.span = days * 86400
+        self.evolving = [(int(entries * fraction), column) for fraction, column in EVOLVING_COLUMNS]
+
+    def _random(self, index: int, salt: int) -> int:
+        return _mix(self.seed, index, salt)
+
+    def workspaces(self) -> list:
+        at = _at(self.start)
+        return [
+            {
+                "id": n,
+                "organization_id": 1,
+                "name": f"Workspace {n}",
+                "premium": n == 1,
+                "admin": True,
+                "default_hourly_rate": None if n % 2 else 50 + n,
+                "default_currency": "USD",
+                "only_admins_may_create_projects": False,
+                "projects_billable_by_default": True,
+                "rounding": 1,
+                "rounding_minutes": 0,
+                "api_token": "synthetic",
+                "at": at,
+                "ical_enabled": n == 1,
+                "logo_url": None,
+            }
+            for n in range(1, self.workspace_count + 1)
+        ]
+
+    def projects(self, workspace_id: int = None) -> list:
+        """Every project, or those of ``workspace_id``."""
+        projects = []
+        for n in range(1, self.project_count + 1):
+            if workspace_id is not None and n % self.workspace_count + 1 != workspace_id:
+                continue
+            value = self._random(n, 1)
+            projects.append(
+                {
+                    "id": n,
+                    "workspace_id": n % self.workspace_count + 1,
+                    "client_id": None if value % 5 == 0 else value % self.client_count + 1,
+                    "name": f"{WORDS[value % len(WORDS)].title()} {n}",
+                    "is_private": value % 3 == 0,
+                    "active": value % 7 != 0,
+                    "billable": value % 2 == 0,
+                    "color": COLORS[value % len(COLORS)],
+                    "estimated_hours": None if value % 4 else value % 200,
+                    "rate": None,
+                    "at": _at(self.start),
+                }
+            )
+        return projects
+
+    def entry_time(self, index: int) -> datetime.datetime:
+        return self.start + datetime.timedelta(seconds=index * self.span // self.entries)
+
+    def index_range(self, start: datetime.datetime, end: datetime.datetime) -> range:
+        """Indexes of the entries starting in ``[start, end)``, in exact integer arithmetic."""
+        bounds = []
+        for moment in (start, end):
+            seconds = int((moment - self.start).total_seconds())
+            bounds.append(min(max(-(-seconds * self.entries // self.span), 0), self.entries))
+        return range(*bounds)
+
+    def time_entry(self, index: int) -> dict:
+        value = self._random(index, 2)
+        start = self.entry_time(index)
+        workspace_id = value % self.workspace_count + 1
+        project_id = None if value % 6 == 0 else (value >> 8) % self.project_count + 1
+        user_id = (value >> 16) % self.user_count + 1
+        tags = [TAGS[(value >> shift) % len(TAGS)] for shift in range(24, 24 + (value >> 20) % 4 * 4, 4)]
+        running = index == self.entries - 1
+        duration = 60 + (value >> 32) % 14400
+        stop = None if running else start + datetime.timedelta(seconds=duration)
+        entry = {
+            "id": index + 1,
+            "workspace_id": workspace_id,
+            "project_id": project_id,
+            "task_id": None,
+            "user_id": user_id,
+            "billable": value % 3 == 0,
+            "start": _at(start),
+            "stop": _at(stop) if stop else None,
+            "duration": -int(start.replace(tzinfo=datetime.timezone.utc).timestamp()) if running else duration,
+            "description": None if value % 11 == 0 else f"{WORDS[(value >> 40) % len(WORDS)]} #{(value >> 48) % 1000}",
+            "tags": sorted(set(tags)),
+            "duronly": False,
+            "at": _at(stop or start),
+            "server_deleted_at": None,
+            "wid": workspace_id,
+            "pid": project_id,
+            "uid": user_id,
+            "shared_with": (
+                [{"user_id": (user_id % self.user_count) + 1, "accepted": value % 2 == 0, "user_name": None}]
+                if value % 9 == 0
+                else None
+            ),
+        }
+        for first, column in self.evolving:
+            if index < first:
+                break
+            if column == "tag_ids":
+                entry["tag_ids"] = [TAGS.index(tag) + 1 for tag in entry["tags"]]
+            elif column == "expense_ids":
+                entry["expense_ids"] = [] if value % 8 else [index]
+            elif column == "permissions":
+                entry["permissions"] = {"edit": value % 2 == 0, "delete": value % 4 == 0, "roles": ["member"]}
+        return entry
+
+    def time_entries(self, first: int = 0, last: int = None) -> Iterator[dict]:
+        for index in range(first, self.entries if last is None else last):
+            yield self.time_entry(index)
+
+    def pages(self, page_size: int = 1000) -> Iterator[list]:
+        """Yield every time entry in lists of ``page_size``, like windows from the API."""
+        for first in range(0, self.entries, page_size):
+            yield list(self.time_entries(first, min(first + page_size, self.entries)))
+
+    def digest(self) -> str:
+        """Hash of every time entry, to check two runs produced identical data."""
+        digest = hashlib.sha256()
+        for page in self.pages():
+            digest.update(repr(page).encode("utf-8"))
+        return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Toggl dataset to a SQLite database")
+    parser.add_argument("db_path")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=DEFAULT_END, help="last day of data, YYYY-MM-DD")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    dataset = TogglDataset(args.entries, args.days, seed=args.seed, end=args.end)
+    db = sqlite_utils.Database(args.db_path)
+    started = time.perf_counter()
+    save_items([dataset.workspaces()], "workspaces", db)
+    save_items([dataset.projects()], "projects", db)
+    stats = save_items(dataset.pages(args.page_size), "time_entries", db)
+    print(f"Saved {stats['rows']} time entries in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
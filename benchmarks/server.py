@@ -0,0 +1,141 @@
+"""Local stand-in for the Toggl API, used to benchmark ``fetch`` offline.
+
+Serves a synthetic :class:`dataset.TogglDataset` at a configurable volume,
+with optional per-request latency and periodic 429 responses. Time entries
+are computed from their index, so millions of them can be served without
+holding them in memory.
+
+Run it on its own with ``python benchmarks/server.py --entries 100000`` and
+point ``toggl-to-sqlite fetch --api-url`` at the URL it prints.
+"""
+
+import argparse
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from dataset import TogglDataset
+
+
+class StandInServer:
+    """Threaded HTTP server answering the endpoints ``fetch`` uses.
+
+    ``entries`` time entries, generated from ``seed``, are spread evenly over
+    the ``days`` days up to today. Every response is delayed by ``latency`` seconds, and every
+    ``throttle_every``-th request is answered with a 429 and ``Retry-After: 0``.
+    """
+
+    def __init__(
+        self,
+        entries: int = 10_000,
+        days: int = 365,
+        workspaces: int = 2,
+        projects: int = 20,
+        latency: float = 0.0,
+        throttle_every: int = 0,
+        port: int = 0,
+        seed: int = 0,
+    ) -> None:
+        self.dataset = TogglDataset(entries, days, seed=seed, workspaces=workspaces, projects=projects, end=datetime.date.today())
+        self.start = self.dataset.start
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.throttled = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v9"
+
+    def respond(self, path: str, query: dict):
+        """Return the status code and JSON body for a request."""
+        with self._lock:
+            self.requests += 1
+            throttle = self.throttle_every and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            return 429, {"error": "rate limited"}
+        parts = path.strip("/").split("/")[2:]
+        if parts == ["workspaces"]:
+            return 200, self.dataset.workspaces()
+        if len(parts) == 3 and parts[0] == "workspaces" and parts[2] == "projects":
+            return 200, self.dataset.projects(int(parts[1]))
+        if parts == ["me", "time_entries"]:
+            start, end = (datetime.datetime.fromisoformat(query[name][0][:10]) for name in ("start_date", "end_date"))
+            return 200, [self.dataset.time_entry(index) for index in self.dataset.index_range(start, end)]
+        return 404, {"error": "not found"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, data = server.respond(url.path, parse_qs(url.query))
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.serve()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = StandInServer(
+        args.entries, args.days, latency=args.latency, throttle_every=args.throttle_every, port=args.port, seed=args.seed
+    )
+    print(f"Serving {args.entries} time entries at {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Tests for the synthetic dataset generator."""
+
+import datetime
+
+import sqlite_utils
+from dataset import DEFAULT_END, TogglDataset
+
+from toggl_to_sqlite.utils import save_items
+
+
+def test_same_seed_same_data():
+    assert TogglDataset(2_000, seed=7).digest() == TogglDataset(2_000, seed=7).digest()
+    assert TogglDataset(2_000, seed=7).digest() != TogglDataset(2_000, seed=8).digest()
+    # Not tied to the day the data is generated on
+    assert TogglDataset(2_000, days=30, seed=7).start == datetime.datetime(2024, 12, 1)
+    assert TogglDataset(2_000, seed=7).digest() == TogglDataset(2_000, seed=7, end=DEFAULT_END).digest()
+    assert TogglDataset(2_000, seed=7).digest() != TogglDataset(2_000, seed=7, end=datetime.date(2025, 1, 1)).digest()
+
+
+def test_any_slice_of_a_large_dataset_is_available():
+    dataset = TogglDataset(5_000_000, days=3650, seed=1)
+    entry = dataset.time_entry(4_999_998)
+
+    assert entry["id"] == 4_999_999
+    assert entry == TogglDataset(5_000_000, days=3650, seed=1).time_entry(4_999_998)
+    # The most recent entry is still running
+    last = dataset.time_entry(4_999_999)
+    assert last["stop"] is None and last["duration"] < 0
+
+
+def test_windows_partition_the_entries():
+    dataset = TogglDataset(1_000, days=10)
+    indexes = []
+    for day in range(-1, 11):
+        start = dataset.start + datetime.timedelta(days=day)
+        indexes.extend(dataset.index_range(start, start + datetime.timedelta(days=1)))
+
+    assert indexes == list(range(1_000))
+
+
+def test_payloads_have_nulls_nested_values_and_evolving_columns():
+    dataset = TogglDataset(4_000, seed=3)
+    entries = list(dataset.time_entries())
+
+    assert any(entry["project_id"] is None for entry in entries)
+    assert any(entry["description"] is None for entry in entries)
+    assert any(entry["tags"] for entry in entries) and any(not entry["tags"] for entry in entries)
+    assert any(entry["shared_with"] for entry in entries)
+    assert "tag_ids" not in entries[0] and "permissions" in entries[-1]
+
+
+def test_evolving_columns_are_added_to_the_table():
+    dataset = TogglDataset(4_000, seed=3)
+    db = sqlite_utils.Database(":memory:")
+
+    stats = save_items(dataset.pages(500), "time_entries", db)
+
+    assert stats["rows"] == 4_000
+    assert {"tag_ids", "expense_ids", "permissions", "shared_with"} <= set(db["time_entries"].columns_dict)
+    assert db["time_entries"].get(4_000)["permissions"].startswith("{")
@@ -0,0 +1,70 @@
+"""End-to-end ``fetch`` benchmarks against the local Toggl API stand-in.
+
+Each scenario runs ``toggl-to-sqlite fetch`` in a fresh process so peak RSS
+is measured for that sync alone. Run with ``pytest benchmarks``, or pick a
+size with ``-k 10k``; ``--bench-json PATH`` keeps the results for comparison.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import sqlite_utils
+from server import StandInServer
+
+SCENARIOS = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+# Days of data served, and the --days window fetched at a time
+SPAN_DAYS = 730
+WINDOW_DAYS = 10
+
+
+def run_fetch(args: list) -> tuple:
+    """Run the CLI in a subprocess, returning its output and peak RSS in MB."""
+    code = "from toggl_to_sqlite.cli import cli; cli()"
+    proc = subprocess.Popen([sys.executable, "-c", code, *args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    assert proc.returncode == 0, output
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return output, peak_rss
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_fetch_throughput(scenario, tmp_path, bench_results):
+    entries = SCENARIOS[scenario]
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "benchmark"}))
+    db_path = tmp_path / "toggl.db"
+
+    with StandInServer(entries, days=SPAN_DAYS, latency=0.005, throttle_every=50) as server:
+        since = server.start.date().isoformat()
+        args = ["fetch", str(db_path), "--auth", str(auth_file), "--api-url", server.url]
+        args += ["--since", since, "--days", str(WINDOW_DAYS), "--concurrency", "4", "--rate-limit", "0"]
+        started = time.perf_counter()
+        output, peak_rss = run_fetch(args)
+        seconds = time.perf_counter() - started
+
+    rows = sqlite_utils.Database(db_path)["time_entries"].count
+    assert rows == entries, output
+    bench_results.append(
+        {
+            "scenario": scenario,
+            "rows": rows,
+            "seconds": seconds,
+            "requests": server.requests,
+            "throttled": server.throttled,
+            "bytes": server.bytes_sent,
+            "requests_per_second": server.requests / seconds,
+            "rows_per_second": rows / seconds,
+            "peak_rss_mb": peak_rss,
+        }
+    )
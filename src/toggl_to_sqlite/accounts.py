@@ -0,0 +1,175 @@
+"""Syncing many Toggl accounts from one process, for ``fetch-many``.
+
+A JSON config lists the accounts, each with its API token (or the path of
+its ``auth.json``) and the database to save it to::
+
+    {"accounts": [{"auth": "alice.json", "db": "alice.db"}, {"api_token": "...", "db": "team.db"}]}
+
+Accounts are synced side by side on one asyncio loop by
+:func:`engine.fetch_async`. They share one HTTP connection pool and one
+thread pool, whose size caps the requests in flight across every account,
+while each token keeps its own rate limit. Every account needs a database
+of its own, as sync times, checkpoints and HTTP validators are kept per
+database.
+"""
+
+import asyncio
+import datetime
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import requests
+import sqlite_utils
+
+from . import database, engine, rollups, utils
+from .client import TogglClient, get_token_bucket, make_session
+from .defaults import API_BASE_URL, DEFAULT_MAX_RETRIES, DEFAULT_RATE_LIMIT
+
+
+def load_config(path: str) -> list:
+    """Read the accounts listed in a ``fetch-many`` config, resolving paths relative to the config file.
+
+    Each account needs a ``db`` and either an ``api_token`` or an ``auth``
+    file; ``name`` (default: the ``db`` path) and ``types`` are optional.
+    Raises ValueError for an account missing any of them, listing a type
+    the async engine does not fetch, or sharing its database with another
+    account.
+    """
+    with open(path) as fp:
+        config = json.load(fp)
+    base = os.path.dirname(os.path.abspath(path))
+    accounts = []
+    databases = set()
+    for number, account in enumerate(config.get("accounts") or [], start=1):
+        if "db" not in account or not ("api_token" in account or "auth" in account):
+            raise ValueError(f"Account {number} in {path} needs a db and an api_token or auth file")
+        api_token = account.get("api_token")
+        if api_token is None:
+            with open(os.path.join(base, account["auth"])) as fp:
+                api_token = json.load(fp)["api_token"]
+        db_path = os.path.normpath(os.path.join(base, account["db"]))
+        if db_path in databases:
+            raise ValueError(f"Account {number} in {path} saves to {account['db']}, which another account already uses")
+        databases.add(db_path)
+        types = tuple(account.get("types") or engine.TYPES)
+        unknown = [name for name in types if name not in engine.TYPES]
+        if unknown:
+            raise ValueError(
+                f"Account {number} in {path} lists unknown types {', '.join(unknown)}; choose from {', '.join(engine.TYPES)}"
+            )
+        accounts.append(
+            {
+                "name": account.get("name") or account["db"],
+                "api_token": api_token,
+                "db": db_path,
+                "types": types,
+            }
+        )
+    if not accounts:
+        raise ValueError(f"{path} lists no accounts")
+    return accounts
+
+
+def _finish(db: sqlite_utils.Database, types: tuple, sync_time: datetime.datetime) -> dict:
+    # What fetch does once the engine has saved everything
+    for table in types:
+        utils.update_sync_time(db, table, sync_time)
+    refreshed = rollups.refresh(db, rollups.touched_ranges(db)) if "time_entries" in types else {}
+    utils.clear_checkpoints(db)
+    database.ensure_indexes(db, types)
+    return refreshed
+
+
+async def sync_account(
+    account: dict,
+    db: sqlite_utils.Database,
+    executor: ThreadPoolExecutor,
+    session: requests.Session,
+    concurrency: int = 4,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    burst: float = 1.0,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    base_url: str = API_BASE_URL,
+    days: int = 25,
+    force_full: bool = False,
+    batch_size: int = None,
+    normalize_tags: bool = False,
+) -> dict:
+    """Sync one account of a config into ``db`` like ``fetch --engine async``, on the shared ``executor`` and ``session``.
+
+    Returns the rows saved and rollup rows refreshed per table, and the API requests made.
+    """
+    loop = asyncio.get_running_loop()
+    api_token, types = account["api_token"], account["types"]
+    client = TogglClient(
+        api_token,
+        base_url=base_url,
+        session=session,
+        rate_limiter=get_token_bucket(api_token, rate_limit, capacity=burst) if rate_limit else None,
+        max_retries=max_retries,
+    )
+    with client:
+        sync_time = datetime.datetime.now(datetime.timezone.utc)
+        entries_days, entries_since = days, None
+        if force_full:
+            utils.clear_checkpoints(db)
+        elif "time_entries" in types:
+            effective_since = await loop.run_in_executor(
+                executor, functools.partial(utils.get_effective_since_date, api_token, "time_entries", db, client=client)
+            )
+            if effective_since:
+                effective_date = effective_since.date() if hasattr(effective_since, "date") else effective_since
+                entries_days, entries_since = (datetime.date.today() - effective_date).days + 1, effective_since
+        saved = await engine.fetch_async(
+            api_token,
+            db,
+            types=types,
+            days=entries_days,
+            since=entries_since,
+            client=client,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            force_full=force_full,
+            normalize_tags=normalize_tags,
+            executor=executor,
+        )
+        refreshed = await loop.run_in_executor(executor, _finish, db, types, sync_time)
+    return {"saved": saved, "refreshed": refreshed, "requests": client.request_count}
+
+
+async def fetch_many_async(accounts: list, concurrency: int = 4, on_done: Callable = None, **options) -> list:
+    """Sync every account from :func:`load_config` at once, with at most ``concurrency`` requests in flight in total.
+
+    ``options`` are passed on to :func:`sync_account`. ``on_done(account,
+    result)`` is called as each account finishes. One account failing does
+    not stop the others: its result, in the list returned in config order,
+    is the exception that stopped it.
+    """
+    session = make_session(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    dbs = {account["db"]: database.connect(account["db"]) for account in accounts}
+
+    async def run(account):
+        try:
+            result = await sync_account(account, dbs[account["db"]], executor, session, concurrency=concurrency, **options)
+        except Exception as error:
+            result = error
+        if on_done:
+            on_done(account, result)
+        return result
+
+    try:
+        return await asyncio.gather(*(run(account) for account in accounts))
+    finally:
+        executor.shutdown(wait=True)
+        session.close()
+        for db in dbs.values():
+            db.close()
+
+
+def fetch_many(*args, **kwargs) -> list:
+    """Run :func:`fetch_many_async` on a fresh event loop."""
+    return asyncio.run(fetch_many_async(*args, **kwargs))
@@ -1,9 +1,64 @@
+import contextlib
 import json
 
 import click
-import sqlite_utils
 
-from . import utils
+from . import profiling
+from .defaults import API_BASE_URL, DEFAULT_MAX_RETRIES, DEFAULT_RATE_LIMIT
+
+# Everything that pulls in requests or sqlite-utils is imported inside the
+# commands that need it, so --help, --version and auth start quickly
+
+
+def echo_saved(table, stats):
+    stats = stats or {"rows": 0, "written": 0, "skipped": 0, "rows_per_second": 0.0}
+    click.echo(
+        f"💾 Saved {stats['rows']} {table}: {stats['written']} written, {stats['skipped']} unchanged "
+        f"({stats['rows_per_second']:,.0f} rows/s)"
+    )
+
+
+def refresh_rollups(db, ranges=None):
+    """Recompute the rollup buckets in ``ranges`` (default: this sync's checkpointed windows), then forget the checkpoints."""
+    from . import rollups, utils
+
+    ranges = rollups.touched_ranges(db) if ranges is None else ranges
+    for table, rows in rollups.refresh(db, ranges).items():
+        click.echo(f"📊 Refreshed {rows} {table} rows")
+    utils.clear_checkpoints(db)
+
+
+def echo_indexed(indexed):
+    if indexed is not None:
+        click.echo(f"🔎 Indexed {indexed} time entries for full-text search")
+
+
+@contextlib.contextmanager
+def api_errors():
+    """Turn a request that still failed once retries ran out into a short error instead of a traceback."""
+    import requests
+
+    from .client import TogglAPIError
+
+    resume = "Windows saved before it are checkpointed, so running fetch again resumes from there."
+    try:
+        yield
+    except TogglAPIError as error:
+        raise click.ClickException(f"Toggl answered {error} after all retries. {resume}") from error
+    except (requests.ConnectionError, requests.Timeout) as error:
+        raise click.ClickException(f"Could not reach Toggl after all retries: {error}. {resume}") from error
+
+
+def parse_pragmas(ctx, param, value):
+    from . import database
+
+    pragmas = {}
+    for pragma in value:
+        name, sep, setting = pragma.partition("=")
+        if not sep or not database.PRAGMA_NAME.match(name.strip().lower()) or not database.PRAGMA_VALUE.match(setting.strip()):
+            raise click.BadParameter(f"{pragma!r} should look like NAME=VALUE")
+        pragmas[name.strip().lower()] = setting.strip()
+    return pragmas
 
 
 @click.group()
@@ -60,52 +115,513 @@ def auth(auth):
 @click.option("-s", "--since", type=click.DateTime(), help="Fetch data since this date (overrides automatic since detection)")
 @click.option("--force-full", is_flag=True, help="Force a full sync, ignoring previous sync times")
 @click.option(
-    "-t", "--type", default=["time_entries", "workspaces", "projects"], required=True, multiple=True, help="Data types to fetch"
+    "-t",
+    "--type",
+    default=["time_entries", "workspaces", "projects"],
+    required=True,
+    multiple=True,
+    help="Data types to fetch: time_entries, workspaces, projects or report_summary",
+)
+@click.option("-c", "--concurrency", type=click.IntRange(min=1), default=1, help="Number of time entry windows to fetch at once")
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_RATE_LIMIT,
+    show_default=True,
+    help="Maximum API requests per second (0 to disable)",
+)
+@click.option(
+    "--engine",
+    "fetch_engine",
+    type=click.Choice(["threads", "async", "reports"]),
+    default="threads",
+    show_default=True,
+    help="Fetch engine: a thread pool per data type, one asyncio loop for everything, "
+    "or threads with every workspace member's time entries from the Reports API",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    help="Also commit every N rows; otherwise each time entry window is committed with its checkpoint "
+    "and other data once per data type",
+)
+@click.option("--fast", is_flag=True, help="Use WAL and faster SQLite settings during the sync, then restore the previous ones")
+@click.option(
+    "--pragma",
+    "pragma_options",
+    multiple=True,
+    callback=parse_pragmas,
+    metavar="NAME=VALUE",
+    help="SQLite pragma to set during the sync, can be used multiple times (overrides --fast)",
+)
+@click.option(
+    "--adaptive",
+    is_flag=True,
+    help="Grow or shrink the time entry window (starting at --days) depending on how busy each window is",
+)
+@click.option(
+    "--delta",
+    is_flag=True,
+    help="Fetch only time entries changed or deleted since the last sync, in one request "
+    "(falls back to date windows if there is no sync from the last 90 days)",
+)
+@click.option(
+    "--reconcile",
+    is_flag=True,
+    help="Compare time entries since --since (default: all) with the database window by window, "
+    "saving only what changed and deleting entries removed from Toggl",
+)
+@click.option(
+    "--normalize-tags",
+    is_flag=True,
+    help="Also keep time entry tags in a tags table, linked to entries through a time_entry_tags table "
+    "(kept up to date by later syncs once created)",
+)
+@click.option(
+    "--fts",
+    "enable_fts",
+    is_flag=True,
+    help="Keep a full-text search index of time entry descriptions, project and client names",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=False),
+    help="Keep workspace and project responses in this file so repeated runs can skip those requests",
+)
+@click.option(
+    "--cache-ttl",
+    type=click.FloatRange(min=0),
+    default=300,
+    show_default=True,
+    help="Seconds a response in the --cache file stays valid",
+)
+@click.option(
+    "--burst",
+    type=click.FloatRange(min=1),
+    default=1.0,
+    show_default=True,
+    help="Requests allowed in a burst before --rate-limit applies",
+)
+@click.option(
+    "--max-retries",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MAX_RETRIES,
+    show_default=True,
+    help="Retries for throttled (429), server error and failed requests",
+)
+@click.option(
+    "--api-url",
+    default=API_BASE_URL,
+    envvar="TOGGL_API_URL",
+    show_default=True,
+    help="Toggl API base URL, e.g. a local stand-in server for benchmarks",
+)
+@click.option(
+    "--metrics",
+    "show_metrics",
+    is_flag=True,
+    help="Print how long since-date resolution, HTTP requests, JSON decoding and inserts took",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=False),
+    help="Write the timings to this file: a Prometheus textfile if it ends in .prom, JSON otherwise",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=False),
+    envvar=profiling.PROFILE_ENV,
+    help=f"Write a cProfile dump of the run, worker threads included, to this file (or set {profiling.PROFILE_ENV})",
 )
-def fetch(db_path, auth, days, since, force_full, type):
+def fetch(
+    db_path,
+    auth,
+    days,
+    since,
+    force_full,
+    type,
+    concurrency,
+    rate_limit,
+    fetch_engine,
+    batch_size,
+    fast,
+    pragma_options,
+    adaptive,
+    delta,
+    reconcile,
+    normalize_tags,
+    enable_fts,
+    cache_path,
+    cache_ttl,
+    burst,
+    max_retries,
+    api_url,
+    show_metrics,
+    metrics_file,
+    profile_path,
+):
     "Save Toggl data to a SQLite database"
     import datetime
 
+    from . import database, engine, fts, reports, utils
+    from .client import ResponseCache, TogglClient, get_token_bucket
+    from .metrics import Metrics
+
+    if adaptive and fetch_engine != "threads":
+        raise click.UsageError("--adaptive is only supported by --engine threads")
+    if reconcile and (adaptive or fetch_engine != "threads"):
+        raise click.UsageError("--reconcile uses fixed --days windows and --engine threads")
+    if profile_path:
+        click.echo(f"🔬 Profiling this run to {profile_path}")
+        click.get_current_context().with_resource(profiling.profile(profile_path))
     auth = json.load(open(auth))
-    db = sqlite_utils.Database(db_path)
-
-    # Get current time for updating sync timestamps
-    sync_time = datetime.datetime.now(datetime.timezone.utc)
-
-    if "time_entries" in type:
-        # Use automatic since detection for time entries (unless force_full is specified)
-        if force_full:
-            click.echo("Force full sync requested - fetching all time entries")
-            effective_since = None
-        else:
-            effective_since = utils.get_effective_since_date(
-                api_token=auth["api_token"], table_name="time_entries", db=db, user_since=since
-            )
-
-        # Only use automatic since if no explicit since date is provided
-        if effective_since and not since and not force_full:
-            # Convert to date for comparison if it's a datetime
-            effective_date = effective_since.date() if hasattr(effective_since, "date") else effective_since
-            days_since_effective = (datetime.datetime.now().date() - effective_date).days + 1  # Add 1 to ensure overlap
-            click.echo(f"📅 Fetching time entries since {effective_date} ({days_since_effective} days)")
-            time_entries = utils.get_time_entries(api_token=auth["api_token"], days=days_since_effective, since=effective_since)
-        else:
-            if since:
-                since_date = since.date() if hasattr(since, "date") else since
-                click.echo(f"📅 Fetching time entries since user-specified date: {since_date}")
+    db = database.connect(db_path)
+    cache = ResponseCache(cache_path, ttl=cache_ttl) if cache_path else None
+    metrics = Metrics()
+    client = TogglClient(
+        auth["api_token"],
+        pool_size=concurrency,
+        base_url=api_url,
+        cache=cache,
+        rate_limiter=get_token_bucket(auth["api_token"], rate_limit, capacity=burst) if rate_limit else None,
+        max_retries=max_retries,
+        metrics=metrics,
+    )
+
+    pragmas = dict(database.FAST_PRAGMAS) if fast else {}
+    pragmas.update(pragma_options)
+
+    with api_errors(), client, database.pragmas(db, pragmas):
+        # Get current time for updating sync timestamps
+        sync_time = datetime.datetime.now(datetime.timezone.utc)
+
+        entries_days, entries_since = days, since
+        use_delta = delta and "time_entries" in type and not (since or force_full or reconcile)
+        delta_since = utils.get_delta_since(db) if use_delta else None
+        if delta_since:
+            click.echo(f"📅 Fetching time entries changed since {delta_since.isoformat(timespec='seconds')}")
+        elif "time_entries" in type:
+            # Use automatic since detection for time entries (unless force_full is specified)
+            if force_full:
+                click.echo("Force full sync requested - fetching all time entries")
+                utils.clear_checkpoints(db)
+                effective_since = None
+            elif reconcile:
+                # Reconciling covers the whole --since range, not just what changed since the last sync
+                effective_since = None
+            else:
+                with metrics.time("since"):
+                    effective_since = utils.get_effective_since_date(
+                        api_token=auth["api_token"], table_name="time_entries", db=db, user_since=since, client=client
+                    )
+
+            # Only use automatic since if no explicit since date is provided
+            if effective_since and not since and not force_full:
+                # Convert to date for comparison if it's a datetime
+                effective_date = effective_since.date() if hasattr(effective_since, "date") else effective_since
+                days_since_effective = (datetime.datetime.now().date() - effective_date).days + 1  # Add 1 to ensure overlap
+                click.echo(f"📅 Fetching time entries since {effective_date} ({days_since_effective} days)")
+                entries_days, entries_since = days_since_effective, effective_since
             else:
-                click.echo(f"📅 Fetching time entries for the last {days} days")
-            time_entries = utils.get_time_entries(api_token=auth["api_token"], days=days, since=since)
+                if since:
+                    since_date = since.date() if hasattr(since, "date") else since
+                    click.echo(f"📅 Fetching time entries since user-specified date: {since_date}")
+                else:
+                    click.echo(f"📅 Fetching time entries for the last {days} days")
+                entries_days, entries_since = days, since
+
+        # Build indexes after the first sync; rebuild them once after a backfill instead of row by row.
+        # Reconciling looks entries up by start, so it keeps them.
+        defer = not reconcile and (force_full or ("time_entries" in type and entries_days > database.BACKFILL_DAYS))
+        with database.deferred_indexes(db, type, defer=defer) as built_indexes:
+            if delta_since:
+                saved = utils.save_time_entries_delta(
+                    auth["api_token"], db, delta_since, client=client, metrics=metrics, normalize_tags=normalize_tags
+                )
+                echo_saved("time_entries", saved)
+                click.echo(f"🗑️  Deleted {saved['deleted']} time_entries")
+                utils.update_sync_time(db, "time_entries", sync_time)
+                refresh_rollups(db, [(day, day) for day in saved["days"]])
+                type = tuple(table for table in type if table != "time_entries")
+            if fetch_engine == "async":
+                saved = engine.fetch(
+                    auth["api_token"],
+                    db,
+                    types=type,
+                    days=entries_days,
+                    since=entries_since,
+                    client=client,
+                    concurrency=concurrency,
+                    batch_size=batch_size,
+                    force_full=force_full,
+                    normalize_tags=normalize_tags,
+                )
+                for table in [table for table in type if table in engine.TYPES]:
+                    echo_saved(table, saved.get(table))
+                    utils.update_sync_time(db, table, sync_time)
+                if "time_entries" in type:
+                    refresh_rollups(db)
+            else:
+                if "time_entries" in type and reconcile:
+                    reconciled = utils.reconcile_time_entries(
+                        auth["api_token"],
+                        db,
+                        days=entries_days,
+                        since=since,
+                        client=client,
+                        concurrency=concurrency,
+                        metrics=metrics,
+                    )
+                    click.echo(
+                        f"🔁 {reconciled['windows_changed']} of {reconciled['windows']} time entry windows differed: "
+                        f"{reconciled['rows']} entries saved, {reconciled['deleted']} deleted"
+                    )
+                    if reconciled["windows_truncated"]:
+                        click.echo(
+                            f"🔁 {reconciled['windows_truncated']} windows had a day over Toggl's "
+                            f"{utils.TIME_ENTRIES_RESULT_CAP} entry limit; nothing was deleted from them"
+                        )
+                    utils.update_sync_time(db, "time_entries", sync_time)
+                    refresh_rollups(db)
+                elif "time_entries" in type and fetch_engine == "reports":
+                    start = utils.get_start_datetime(auth["api_token"], entries_since, client=client, db=db)
+                    time_entries = reports.get_time_entries(auth["api_token"], start, client=client, concurrency=concurrency)
+                    echo_saved(
+                        "time_entries",
+                        utils.save_items(
+                            time_entries,
+                            "time_entries",
+                            db,
+                            batch_size=batch_size,
+                            metrics=metrics,
+                            normalize_tags=normalize_tags,
+                            skip_unchanged=not force_full,
+                        ),
+                    )
+                    utils.update_sync_time(db, "time_entries", sync_time)
+                    refresh_rollups(db, [(start, datetime.date.today())])
+                elif "time_entries" in type:
+                    time_entries = utils.get_time_entries(
+                        api_token=auth["api_token"],
+                        days=entries_days,
+                        since=entries_since,
+                        client=client,
+                        concurrency=concurrency,
+                        adaptive=adaptive,
+                        db=db,
+                    )
+                    echo_saved(
+                        "time_entries",
+                        utils.save_items(
+                            time_entries,
+                            "time_entries",
+                            db,
+                            batch_size=batch_size,
+                            metrics=metrics,
+                            normalize_tags=normalize_tags,
+                            skip_unchanged=not force_full,
+                        ),
+                    )
+                    utils.update_sync_time(db, "time_entries", sync_time)
+                    refresh_rollups(db)
+
+                if "workspaces" in type:
+                    workspaces = utils.get_workspaces(api_token=auth["api_token"], client=client, db=db, force_full=force_full)
+                    echo_saved(
+                        "workspaces",
+                        utils.save_items(
+                            workspaces, "workspaces", db, batch_size=batch_size, metrics=metrics, skip_unchanged=not force_full
+                        ),
+                    )
+                    utils.update_sync_time(db, "workspaces", sync_time)
+
+                if "projects" in type:
+                    projects = utils.get_projects(api_token=auth["api_token"], client=client, db=db, force_full=force_full)
+                    echo_saved(
+                        "projects",
+                        utils.save_items(
+                            projects, "projects", db, batch_size=batch_size, metrics=metrics, skip_unchanged=not force_full
+                        ),
+                    )
+                    utils.update_sync_time(db, "projects", sync_time)
+
+            if reports.SUMMARY_TABLE in type:
+                start = utils.get_start_datetime(auth["api_token"], entries_since, client=client, db=db)
+                months = reports.get_summary(auth["api_token"], start, client=client, concurrency=concurrency)
+                summary = reports.replace_months(db, months)
+                echo_saved(
+                    reports.SUMMARY_TABLE,
+                    utils.save_items(summary, reports.SUMMARY_TABLE, db, batch_size=batch_size, metrics=metrics),
+                )
+                utils.update_sync_time(db, reports.SUMMARY_TABLE, sync_time)
+        if built_indexes:
+            click.echo(f"🗂️  Built {len(built_indexes)} indexes: {', '.join(built_indexes)}")
+        if enable_fts:
+            # Once built, triggers keep the index up to date, so this only does work on the first run
+            echo_indexed(fts.ensure(db))
+
+    stats = client.stats()
+    click.echo(
+        f"🔌 {stats['requests']} API requests, {stats['connections_opened']} connections opened, "
+        f"{stats['connections_reused']} reused, {stats['cache_hits']} served from cache"
+    )
+    if stats["throttled"] or stats["retried"] or stats["failed"]:
+        click.echo(f"⏳ {stats['throttled']} throttled, {stats['retried']} retried, {stats['failed']} failed")
+    if show_metrics:
+        for line in metrics.table():
+            click.echo(f"⏱️  {line}")
+    if metrics_file:
+        metrics.write(metrics_file)
+
+
+@cli.command(name="fetch-many")
+@click.argument("config", type=click.Path(exists=True, file_okay=True, dir_okay=False, allow_dash=False), required=True)
+@click.option(
+    "-c",
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Requests in flight at once across all accounts, through one shared connection pool",
+)
+@click.option(
+    "--rate-limit",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_RATE_LIMIT,
+    show_default=True,
+    help="Maximum API requests per second for each API token (0 to disable)",
+)
+@click.option(
+    "--burst",
+    type=click.FloatRange(min=1),
+    default=1.0,
+    show_default=True,
+    help="Requests allowed in a burst before --rate-limit applies",
+)
+@click.option(
+    "--max-retries",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MAX_RETRIES,
+    show_default=True,
+    help="Retries for throttled (429), server error and failed requests",
+)
+@click.option(
+    "-d", "--days", type=int, default=25, help="Number of days to fetch (only used if no automatic since date is available)"
+)
+@click.option("--force-full", is_flag=True, help="Force a full sync, ignoring previous sync times")
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    help="Also commit every N rows; otherwise each time entry window is committed with its checkpoint "
+    "and other data once per data type",
+)
+@click.option(
+    "--normalize-tags",
+    is_flag=True,
+    help="Also keep time entry tags in a tags table, linked to entries through a time_entry_tags table "
+    "(kept up to date by later syncs once created)",
+)
+@click.option(
+    "--api-url",
+    default=API_BASE_URL,
+    envvar="TOGGL_API_URL",
+    show_default=True,
+    help="Toggl API base URL, e.g. a local stand-in server for benchmarks",
+)
+def fetch_many(config, concurrency, rate_limit, burst, max_retries, days, force_full, batch_size, normalize_tags, api_url):
+    "Sync every account listed in a JSON config file at once"
+    from . import accounts
 
-        utils.save_items(time_entries, "time_entries", db)
-        utils.update_sync_time(db, "time_entries", sync_time)
+    try:
+        listed = accounts.load_config(config)
+    except (ValueError, OSError, KeyError) as error:
+        raise click.ClickException(f"Could not load {config}: {error}")
+    databases = len({account["db"] for account in listed})
+    click.echo(f"👥 Syncing {len(listed)} accounts into {databases} databases, {concurrency} requests at a time")
 
-    if "workspaces" in type:
-        workspaces = utils.get_workspaces(api_token=auth["api_token"])
-        utils.save_items(workspaces, "workspaces", db)
-        utils.update_sync_time(db, "workspaces", sync_time)
+    def on_done(account, result):
+        if isinstance(result, Exception):
+            click.echo(f"❌ {account['name']}: {result}", err=True)
+            return
+        click.echo(f"👥 {account['name']}: {result['requests']} API requests")
+        for table in account["types"]:
+            echo_saved(table, result["saved"].get(table))
+        for table, rows in result["refreshed"].items():
+            click.echo(f"📊 Refreshed {rows} {table} rows")
 
-    if "projects" in type:
-        projects = utils.get_projects(api_token=auth["api_token"])
-        utils.save_items(projects, "projects", db)
-        utils.update_sync_time(db, "projects", sync_time)
+    results = accounts.fetch_many(
+        listed,
+        concurrency=concurrency,
+        on_done=on_done,
+        rate_limit=rate_limit,
+        burst=burst,
+        max_retries=max_retries,
+        base_url=api_url,
+        days=days,
+        force_full=force_full,
+        batch_size=batch_size,
+        normalize_tags=normalize_tags,
+    )
+    failed = sum(isinstance(result, Exception) for result in results)
+    if failed:
+        raise click.ClickException(f"{failed} of {len(listed)} accounts failed")
+
+
+@cli.command(name="ensure-indexes")
+@click.argument(
+    "db_path",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False, allow_dash=False),
+    required=True,
+)
+@click.option("--rebuild", is_flag=True, help="Drop and recreate the indexes instead of only creating missing ones")
+def ensure_indexes(db_path, rebuild):
+    "Create the indexes report queries need on synced tables"
+    from . import database
+
+    db = database.connect(db_path)
+    if rebuild:
+        database.drop_indexes(db)
+    built = database.ensure_indexes(db)
+    for name in built:
+        click.echo(f"🗂️  Built {name}")
+    if not built:
+        click.echo("🗂️  All indexes already exist")
+
+
+@cli.command(name="enable-fts")
+@click.argument(
+    "db_path",
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=False),
+    required=True,
+)
+@click.option("--disable", is_flag=True, help="Remove the index and its triggers instead")
+def enable_fts(db_path, disable):
+    "Build the full-text search index over time entries, kept up to date by later syncs"
+    from . import database, fts
+
+    db = database.connect(db_path)
+    if disable:
+        fts.disable(db)
+        click.echo(f"🔎 Removed {fts.FTS_TABLE}")
+    else:
+        echo_indexed(fts.enable(db))
+
+
+@cli.command(name="profile-report")
+@click.argument("profile_path", type=click.Path(exists=True, file_okay=True, dir_okay=False, allow_dash=False))
+@click.option("-n", "--limit", type=click.IntRange(min=1), default=20, show_default=True, help="Number of functions to show")
+@click.option(
+    "--sort",
+    type=click.Choice(list(profiling.SORT_KEYS)),
+    default="cumulative",
+    show_default=True,
+    help="Order by time including callees, time in the function itself, or number of calls",
+)
+@click.option("--all", "show_all", is_flag=True, help="Include every function, not just toggl_to_sqlite and sqlite_utils")
+def profile_report(profile_path, limit, sort, show_all):
+    "Summarise the hottest functions in a fetch --profile dump"
+    rows = profiling.hottest(profile_path, limit=limit, sort=sort, packages=() if show_all else profiling.REPORT_PACKAGES)
+    for line in profiling.report(rows):
+        click.echo(line)
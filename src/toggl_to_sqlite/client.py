@@ -0,0 +1,388 @@
+import contextlib
+import datetime
+import email.utils
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import __version__
+from .defaults import API_BASE_URL, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE, REPORTS_API_PATH
+from .metrics import Metrics
+
+# Exponential backoff starts at BACKOFF_BASE seconds and is capped at BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "User-Agent": f"toggl-to-sqlite/{__version__}",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to keep requests under a rate limit.
+
+    ``rate`` tokens are added per second, up to ``capacity``; each request
+    takes one token and waits until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available. Returns the time waited."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for ``seconds``, e.g. after the server asks us to slow down."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+_token_buckets = {}
+_token_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(api_token: str, rate: float, capacity: float = 1.0) -> TokenBucket:
+    """Return the process-wide bucket for ``api_token``, creating it on first use.
+
+    Clients for the same token share it, so running several syncs for one
+    account in a single process still respects that token's rate limit.
+    """
+    with _token_buckets_lock:
+        bucket = _token_buckets.get(api_token)
+        if bucket is None:
+            bucket = _token_buckets[api_token] = TokenBucket(rate, capacity=capacity)
+        return bucket
+
+
+class TogglAPIError(requests.HTTPError):
+    """Raised when a request still fails once its retries are used up."""
+
+
+def parse_retry_after(value: str) -> float | None:
+    """Return the number of seconds a ``Retry-After`` header asks us to wait."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (zero-based) retry attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def strip_secrets(data):
+    """Remove API tokens (which Toggl includes in workspace objects) from a response body."""
+    for item in data if isinstance(data, list) else [data]:
+        if isinstance(item, dict):
+            item.pop("api_token", None)
+    return data
+
+
+class CachedResponse:
+    """Stands in for a ``requests.Response`` served from a :class:`ResponseCache`."""
+
+    def __init__(self, status_code: int, text: str, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """Cache of successful JSON responses keyed by URL, query parameters and API token.
+
+    Without a ``path`` the cache only lives as long as the client, which is
+    enough to avoid repeating reference-data calls within one sync. With a
+    ``path`` entries are persisted as JSON and reused by later runs for up
+    to ``ttl`` seconds. Entries are keyed by a hash of the token that fetched
+    them, so a file shared by several accounts never serves one account's
+    data to another. API tokens are stripped before anything is cached,
+    and the file is only readable by its owner.
+    """
+
+    def __init__(self, path: str = None, ttl: float = None) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                self.entries = {key: entry for key, entry in json.load(fp).items() if self._fresh(entry)}
+
+    @staticmethod
+    def key(url: str, params=None, identity: str = None) -> str:
+        items = params.items() if isinstance(params, dict) else (params or ())
+        key = [url, sorted([str(name), str(value)] for name, value in items)]
+        if identity:
+            key.append(identity)
+        return json.dumps(key)
+
+    def _fresh(self, entry: dict) -> bool:
+        return self.ttl is None or time.time() - entry["stored"] < self.ttl
+
+    def get(self, key: str) -> CachedResponse:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or not self._fresh(entry):
+                return None
+            self.hits += 1
+        return CachedResponse(200, entry["text"], entry.get("headers"))
+
+    def set(self, key: str, data, headers: dict = None) -> None:
+        entry = {"stored": time.time(), "text": json.dumps(strip_secrets(data))}
+        if headers:
+            entry["headers"] = {name: value for name, value in headers.items() if value}
+        with self._lock:
+            self.entries[key] = entry
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            entries = {key: entry for key, entry in self.entries.items() if self._fresh(entry)}
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(self.path, 0o600)
+        with os.fdopen(fd, "w") as fp:
+            json.dump(entries, fp)
+
+
+def make_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Return a session sending the default headers through a connection pool of ``pool_size``.
+
+    Pass it to several :class:`TogglClient` instances to share one pool between API tokens.
+    """
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TogglClient:
+    """Pooled HTTP client shared by every Toggl API call in a sync run.
+
+    Owns a single ``requests.Session`` so connections are kept alive and
+    reused between requests instead of paying a TCP+TLS handshake each time.
+
+    Every request first takes a token from the client's :class:`TokenBucket`
+    (pass ``rate_limiter`` to share one bucket between clients using the same
+    API token). Rate-limited (429) and server error responses, and connection
+    failures, are retried up to ``max_retries`` times with jittered
+    exponential backoff, honouring ``Retry-After`` when the server sends it.
+
+    With ``metrics`` every request's latency, status and size, and the time
+    spent decoding JSON through :meth:`decode`, are recorded.
+
+    Pass ``session`` (see :func:`make_session`) to share one connection pool
+    with other clients; the token is then sent with each request, and the
+    session is left open when the client closes.
+    """
+
+    def __init__(
+        self,
+        api_token: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        base_url: str = API_BASE_URL,
+        rate_limit: float = None,
+        cache: ResponseCache = None,
+        burst: float = 1.0,
+        rate_limiter: TokenBucket = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        metrics: Metrics = None,
+        session: requests.Session = None,
+    ) -> None:
+        self.api_token = api_token
+        self.base_url = base_url.rstrip("/")
+        self.auth = (api_token, "api_token")
+        # Scopes cached responses to the token without storing the token itself
+        self.identity = hashlib.sha256(api_token.encode("utf-8")).hexdigest()[:16]
+        self.owns_session = session is None
+        self.session = session or make_session(pool_size)
+        if self.owns_session:
+            self.session.auth = self.auth
+        self.adapter = self.session.get_adapter(self.base_url)
+        self.rate_limiter = rate_limiter or (TokenBucket(rate_limit, capacity=burst) if rate_limit else None)
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self.cache = cache or ResponseCache()
+        self.request_count = 0
+        self.throttled = 0
+        self.retried = 0
+        self.failed = 0
+        self._closed_pool_counts = None
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        """Return an absolute URL for ``path`` relative to the API base URL."""
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _wait(self, seconds: float) -> None:
+        if self.rate_limiter:
+            self.rate_limiter.pause(seconds)
+        else:
+            time.sleep(seconds)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request, retrying throttled, failed and unreachable attempts.
+
+        Returns the last response once it succeeds or retries run out;
+        connection errors are re-raised when retries run out.
+        """
+        url = self.url(path)
+        kwargs.setdefault("auth", self.auth)
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            self._count("request_count")
+            started = time.perf_counter()
+            try:
+                response = getattr(self.session, method.lower())(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                if self.metrics is not None:
+                    self.metrics.observe_response(
+                        response.status_code, time.perf_counter() - started, len(response.content or b"")
+                    )
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if response.status_code == 429:
+                    self._count("throttled")
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    return response
+                delay = backoff_delay(attempt)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+            self._count("retried")
+            self._wait(delay)
+            attempt += 1
+
+    def get(self, path: str, cache: bool = False, **kwargs) -> requests.Response:
+        """Issue a GET request through the pooled session.
+
+        With ``cache`` a successful response is memoized, and later identical
+        requests on this client are answered without touching the network.
+        """
+        if cache:
+            key = self.cache_key(path, kwargs.get("params"))
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        response = self.request("GET", path, **kwargs)
+        if cache and response.status_code == 200:
+            self.cache.set(key, response.json())
+        return response
+
+    def cache_key(self, path: str, params=None) -> str:
+        """The :class:`ResponseCache` key of ``path`` and ``params`` for this client's API token."""
+        return self.cache.key(self.url(path), params, identity=self.identity)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        """Issue a POST request through the pooled session, e.g. a Reports API search."""
+        return self.request("POST", path, **kwargs)
+
+    def reports_url(self, path: str) -> str:
+        """Return an absolute Reports API v3 URL for ``path``, on the same host as the API base URL."""
+        root = self.base_url.removesuffix("/api/v9")
+        return f"{root}/{REPORTS_API_PATH}/{path.lstrip('/')}"
+
+    def decode(self, response: requests.Response):
+        """Return the JSON body of ``response``, timing the decode when collecting metrics."""
+        if self.metrics is None:
+            return response.json()
+        with self.metrics.time("json_decode"):
+            return response.json()
+
+    def _pool_counts(self) -> tuple:
+        if self._closed_pool_counts is not None:
+            return self._closed_pool_counts
+        opened = 0
+        served = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+        return opened, served
+
+    def stats(self) -> dict:
+        """Return connection-reuse statistics for the requests made so far, also after the client is closed."""
+        opened, served = self._pool_counts()
+        return {
+            "requests": self.request_count,
+            "connections_opened": opened,
+            "connections_reused": max(served - opened, 0),
+            "cache_hits": self.cache.hits,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    def close(self) -> None:
+        self.cache.save()
+        if self.owns_session:
+            # Closing the session empties its pools, so keep their counts for stats()
+            self._closed_pool_counts = self._pool_counts()
+            self.session.close()
+
+    def __enter__(self) -> "TogglClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+@contextlib.contextmanager
+def ensure_client(api_token: str, client: TogglClient = None, **kwargs):
+    """Yield ``client``, or a new :class:`TogglClient` that is closed once the block exits."""
+    if client is not None:
+        yield client
+        return
+    with TogglClient(api_token, **kwargs) as own_client:
+        yield own_client
@@ -0,0 +1,129 @@
+import contextlib
+import re
+import sqlite3
+from typing import Iterator
+
+import sqlite_utils
+
+# Settings used by ``fetch --fast``: WAL lets readers such as Datasette keep
+# querying while a sync writes, and the rest trade durability on power loss
+# (never consistency) for fewer fsyncs and more caching
+FAST_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "memory",
+}
+
+PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+PRAGMA_VALUE = re.compile(r"^-?\w+$")
+
+
+def connect(path: str) -> sqlite_utils.Database:
+    """Open ``path`` with a connection that may be used from another thread, such as the async engine's writer."""
+    return sqlite_utils.Database(sqlite3.connect(str(path), check_same_thread=False))
+
+
+def get_pragma(db: sqlite_utils.Database, name: str):
+    return db.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def set_pragmas(db: sqlite_utils.Database, pragmas: dict) -> dict:
+    """Apply ``pragmas`` and return the values they replaced."""
+    previous = {}
+    for name, value in pragmas.items():
+        name = name.lower()
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Invalid pragma: {name}={value}")
+        previous[name] = get_pragma(db, name)
+        db.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+
+def restore_pragmas(db: sqlite_utils.Database, previous: dict) -> None:
+    for name, value in previous.items():
+        try:
+            db.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.OperationalError:
+            # Leaving WAL fails while another connection (e.g. Datasette) has the
+            # database open; the database is still consistent in WAL mode
+            pass
+
+
+@contextlib.contextmanager
+def pragmas(db: sqlite_utils.Database, pragmas: dict) -> Iterator[dict]:
+    """Apply ``pragmas`` for the duration of the block, then restore the previous values."""
+    previous = set_pragmas(db, pragmas)
+    try:
+        yield previous
+    finally:
+        if db.conn.in_transaction:
+            db.conn.commit()
+        restore_pragmas(db, previous)
+
+
+# Columns report queries filter on, indexed once a table exists
+INDEXES = {
+    "time_entries": [["start"], ["project_id"], ["workspace_id"], ["user_id"]],
+    "projects": [["workspace_id"]],
+}
+# Fetching more days than this drops the indexes and builds them after the load
+BACKFILL_DAYS = 90
+
+
+def index_name(table: str, columns: list) -> str:
+    return "idx_{}_{}".format(table, "_".join(columns))
+
+
+def ensure_indexes(db: sqlite_utils.Database, tables: list = None) -> list:
+    """Create any missing :data:`INDEXES` for ``tables`` (default all), returning the names created.
+
+    Indexes on columns a table does not have yet are skipped.
+    """
+    created = []
+    for table in tables or INDEXES:
+        if table not in INDEXES or not db[table].exists():
+            continue
+        existing = {index.name for index in db[table].indexes}
+        columns = set(db[table].columns_dict)
+        for index_columns in INDEXES[table]:
+            name = index_name(table, index_columns)
+            if name not in existing and set(index_columns) <= columns:
+                db[table].create_index(index_columns, index_name=name, if_not_exists=True)
+                created.append(name)
+    return created
+
+
+def drop_indexes(db: sqlite_utils.Database, tables: list = None) -> list:
+    """Drop the :data:`INDEXES` that exist for ``tables`` (default all), returning their names."""
+    dropped = []
+    for table in tables or INDEXES:
+        if table not in INDEXES or not db[table].exists():
+            continue
+        existing = {index.name for index in db[table].indexes}
+        for index_columns in INDEXES[table]:
+            name = index_name(table, index_columns)
+            if name in existing:
+                db.execute(f"DROP INDEX [{name}]")
+                dropped.append(name)
+    if db.conn.in_transaction:
+        db.conn.commit()
+    return dropped
+
+
+@contextlib.contextmanager
+def deferred_indexes(db: sqlite_utils.Database, tables: list, defer: bool = False) -> Iterator[list]:
+    """Ensure the indexes for ``tables`` exist after the block.
+
+    With ``defer`` they are dropped first so a bulk load does not update them
+    row by row; building them once afterwards is much faster. The list
+    yielded is filled with the names of the indexes built.
+    """
+    if defer:
+        drop_indexes(db, tables)
+    built = []
+    try:
+        yield built
+    finally:
+        built.extend(ensure_indexes(db, tables))
@@ -0,0 +1,13 @@
+"""Defaults shared by the client and the CLI.
+
+They live apart from :mod:`toggl_to_sqlite.client` so the CLI can build its
+options without importing ``requests``.
+"""
+
+API_BASE_URL = "https://api.track.toggl.com/api/v9"
+# The Reports API v3 lives beside the v9 API on the same host
+REPORTS_API_PATH = "reports/api/v3"
+DEFAULT_POOL_SIZE = 10
+# Toggl asks for no more than one request per second per API token
+DEFAULT_RATE_LIMIT = 1.0
+DEFAULT_MAX_RETRIES = 5
@@ -0,0 +1,170 @@
+"""asyncio fetch engine.
+
+Fetches workspaces, per-workspace projects and time entry windows
+concurrently on one event loop, while a single writer saves everything
+to SQLite through ``utils.save_items`` on its own thread.
+"""
+
+import asyncio
+import collections
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlite_utils
+
+from . import utils
+from .client import TogglClient, ensure_client
+
+TYPES = ("time_entries", "workspaces", "projects")
+
+
+async def fetch_async(
+    api_token: str,
+    db: sqlite_utils.Database,
+    types: tuple = TYPES,
+    days: int = 25,
+    since: datetime.datetime = None,
+    client: TogglClient = None,
+    concurrency: int = 4,
+    batch_size: int = None,
+    force_full: bool = False,
+    normalize_tags: bool = False,
+    executor: ThreadPoolExecutor = None,
+) -> dict:
+    """Fetch ``types`` for one account and save them to ``db``.
+
+    Blocking HTTP calls run on a thread pool of ``concurrency`` workers shared by
+    the account, so many accounts can be awaited side by side on one loop, and
+    at most ``concurrency`` time entry windows are in flight at once. Pass
+    ``executor`` to run the HTTP calls on a pool shared with other accounts
+    instead, capping requests in flight across all of them.
+
+    Every write happens on a dedicated writer thread, so ``db`` must be opened
+    with ``check_same_thread=False`` (see :func:`database.connect`). If the
+    writer or a fetch fails, everything else is cancelled, uncommitted rows
+    are rolled back and the exception is raised.
+
+    Workspaces and projects are requested conditionally against the
+    validators in ``db``'s ``_http_cache`` (ignored under ``force_full``)
+    and only saved when they changed. Time entry windows are checkpointed
+    like :func:`utils.get_time_entries` does, and resumed from the first
+    window not checkpointed. ``normalize_tags`` is passed on to
+    :func:`utils.get_writer`, and rows matching the stored ones are only
+    rewritten under ``force_full``.
+    Returns the writer statistics for each table saved.
+    """
+    with ensure_client(api_token, client, pool_size=concurrency) as client:
+        loop = asyncio.get_running_loop()
+        own_executor = executor is None
+        executor = executor or ThreadPoolExecutor(max_workers=concurrency)
+        write_executor = ThreadPoolExecutor(max_workers=1)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        writers: dict = {}
+
+        def call(func, *args, **kwargs):
+            return loop.run_in_executor(executor, lambda: func(*args, **kwargs))
+
+        def write(func, *args, **kwargs):
+            return loop.run_in_executor(write_executor, lambda: func(*args, **kwargs))
+
+        async def save():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                table, items, on_saved = job
+                if table not in writers:
+                    writers[table] = await write(
+                        utils.get_writer,
+                        db,
+                        table,
+                        batch_size=batch_size,
+                        metrics=client.metrics,
+                        normalize_tags=normalize_tags,
+                        skip_unchanged=not force_full,
+                    )
+                await write(utils.save_items, items, table, db, writer=writers[table])
+                if on_saved:
+                    await write(on_saved)
+
+        def saved_validators(validators):
+            return functools.partial(utils.save_http_validators, db, validators)
+
+        async def get_if_changed(path, table_name, params=None):
+            # Validators are read on the writer thread, then the request is made on the pool
+            stored = await write(utils.load_http_validators, db, client, path, table_name, params, force_full)
+            return await call(utils.fetch_if_changed, client, path, table_name, stored, params)
+
+        async def fetch_time_entries():
+            await get_if_changed("workspaces", "workspaces")
+            start_date = await call(utils.get_start_datetime, api_token, since, client=client)
+            resume_date = await write(utils.get_resume_date, db, start_date)
+
+            async def put_window(window, future):
+                entries = await future
+                checkpoint = functools.partial(utils.record_checkpoint, db, *utils.window_dates(window), entries)
+                await queue.put(("time_entries", [entries], checkpoint))
+
+            # Queue windows in chronological order, keeping at most ``concurrency`` in flight
+            pending = collections.deque()
+            for window in utils.get_time_entry_windows(start_date, days):
+                if utils.window_dates(window)[1] <= resume_date:
+                    continue
+                pending.append((window, call(utils.get_time_entries_window, client, window)))
+                if len(pending) >= concurrency:
+                    await put_window(*pending.popleft())
+            while pending:
+                await put_window(*pending.popleft())
+
+        async def fetch_projects(workspace):
+            projects, validators = await get_if_changed(f"workspaces/{workspace['id']}/projects", "projects", {"active": "both"})
+            if validators:
+                await queue.put(("projects", [projects] if projects else [], saved_validators(validators)))
+
+        async def fetch_reference_data():
+            if "workspaces" in types:
+                workspaces, validators = await get_if_changed("workspaces", "workspaces")
+                if validators:
+                    await queue.put(("workspaces", [workspaces], saved_validators(validators)))
+            if "projects" in types:
+                workspaces, validators = await get_if_changed("workspaces", "projects")
+                if validators:
+                    await queue.put(("projects", [], saved_validators(validators)))
+                await asyncio.gather(*(fetch_projects(workspace) for workspace in workspaces or []))
+
+        async def produce():
+            jobs = []
+            if "time_entries" in types:
+                jobs.append(fetch_time_entries())
+            if "workspaces" in types or "projects" in types:
+                jobs.append(fetch_reference_data())
+            await asyncio.gather(*jobs)
+            await queue.put(None)
+
+        def close_writers():
+            return {table: table_writer.close() for table, table_writer in writers.items()}
+
+        tasks = [asyncio.ensure_future(save()), asyncio.ensure_future(produce())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+            saved = await write(close_writers)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Queued behind any write still running, as the writer thread runs one job at a time
+            await write(db.conn.rollback)
+            raise
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+            write_executor.shutdown(wait=False)
+        return saved
+
+
+def fetch(*args, **kwargs) -> dict:
+    """Run :func:`fetch_async` on a fresh event loop."""
+    return asyncio.run(fetch_async(*args, **kwargs))
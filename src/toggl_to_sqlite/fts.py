@@ -0,0 +1,112 @@
+"""Full-text search over time entries for ``fetch --fts`` and ``enable-fts``.
+
+``time_entries_fts`` is an FTS5 table with one row per time entry (its
+rowid is the entry id) holding the description and the names of the
+entry's project and client. Triggers on ``time_entries`` and ``projects``
+(and ``clients``, if the database has one) keep it in step with every
+write, so it only has to be built once.
+"""
+
+import sqlite_utils
+
+FTS_TABLE = "time_entries_fts"
+COLUMNS = ("description", "project", "client")
+
+
+def _client_name(db: sqlite_utils.Database, project_id: str) -> str:
+    """SQL for the client name of project ``project_id``, from whatever the database has."""
+    if db["clients"].exists():
+        return f"(SELECT c.name FROM [projects] p JOIN [clients] c ON c.id = p.client_id WHERE p.id = {project_id})"
+    if "client_name" in db["projects"].columns_dict:
+        return f"(SELECT client_name FROM [projects] WHERE id = {project_id})"
+    return "NULL"
+
+
+def _index_entry_sql(db: sqlite_utils.Database, entry: str) -> str:
+    return (
+        f"INSERT OR REPLACE INTO [{FTS_TABLE}] (rowid, description, project, client) VALUES "
+        f"({entry}.id, {entry}.description, (SELECT name FROM [projects] WHERE id = {entry}.project_id), "
+        f"{_client_name(db, f'{entry}.project_id')});"
+    )
+
+
+def triggers(db: sqlite_utils.Database) -> dict:
+    """Name and SQL of every trigger keeping the index in step."""
+    index_entry = _index_entry_sql(db, "new")
+    reindex_project = (
+        f"UPDATE [{FTS_TABLE}] SET project = new.name, client = {_client_name(db, 'new.id')} "
+        f"WHERE rowid IN (SELECT id FROM [time_entries] WHERE project_id = new.id);"
+    )
+    sql = {
+        f"{FTS_TABLE}_entry_insert": f"AFTER INSERT ON [time_entries] BEGIN {index_entry} END",
+        f"{FTS_TABLE}_entry_update": f"AFTER UPDATE ON [time_entries] BEGIN {index_entry} END",
+        f"{FTS_TABLE}_entry_delete": f"AFTER DELETE ON [time_entries] BEGIN DELETE FROM [{FTS_TABLE}] WHERE rowid = old.id; END",
+        f"{FTS_TABLE}_project_insert": f"AFTER INSERT ON [projects] BEGIN {reindex_project} END",
+        f"{FTS_TABLE}_project_update": f"AFTER UPDATE ON [projects] BEGIN {reindex_project} END",
+    }
+    if db["clients"].exists():
+        reindex_client = (
+            f"UPDATE [{FTS_TABLE}] SET client = new.name WHERE rowid IN "
+            f"(SELECT t.id FROM [time_entries] t JOIN [projects] p ON p.id = t.project_id WHERE p.client_id = new.id);"
+        )
+        sql[f"{FTS_TABLE}_client_insert"] = f"AFTER INSERT ON [clients] BEGIN {reindex_client} END"
+        sql[f"{FTS_TABLE}_client_update"] = f"AFTER UPDATE ON [clients] BEGIN {reindex_client} END"
+    return sql
+
+
+def installed_triggers(db: sqlite_utils.Database) -> dict:
+    rows = db.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE '{FTS_TABLE}_%'").fetchall()
+    return dict(rows)
+
+
+def is_enabled(db: sqlite_utils.Database) -> bool:
+    return db[FTS_TABLE].exists()
+
+
+def disable(db: sqlite_utils.Database) -> None:
+    with db.conn:
+        for name in installed_triggers(db):
+            db.execute(f"DROP TRIGGER [{name}]")
+        db.execute(f"DROP TABLE IF EXISTS [{FTS_TABLE}]")
+
+
+def ensure(db: sqlite_utils.Database) -> int:
+    """Enable the index if it is missing or its triggers are out of date, returning the entries indexed.
+
+    Triggers go out of date when, for example, a ``clients`` table appears.
+    Returns None, without touching the index, if it was current.
+    """
+    if is_enabled(db) and db["projects"].exists():
+        expected = {name: f"CREATE TRIGGER [{name}] {sql}" for name, sql in triggers(db).items()}
+        if installed_triggers(db) == expected:
+            return None
+    return enable(db)
+
+
+def enable(db: sqlite_utils.Database) -> int:
+    """(Re)create the index and its triggers, indexing every time entry saved so far. Returns the entries indexed.
+
+    ``time_entries`` and ``projects`` are created, or given the columns the
+    triggers read, if they do not have them yet.
+    """
+    disable(db)
+    with db.conn:
+        for table, columns in (
+            ("time_entries", {"id": int, "description": str, "project_id": int}),
+            ("projects", {"id": int, "name": str}),
+        ):
+            if not db[table].exists():
+                db[table].create(columns, pk="id")
+            for column, column_type in columns.items():
+                if column not in db[table].columns_dict:
+                    db[table].add_column(column, column_type)
+        db.execute(f"CREATE VIRTUAL TABLE [{FTS_TABLE}] USING FTS5 ({', '.join(COLUMNS)})")
+        for name, sql in triggers(db).items():
+            db.execute(f"CREATE TRIGGER [{name}] {sql}")
+        db.execute(
+            f"INSERT INTO [{FTS_TABLE}] (rowid, description, project, client) "
+            f"SELECT t.id, t.description, p.name, {_client_name(db, 't.project_id')} "
+            "FROM [time_entries] t LEFT JOIN [projects] p ON p.id = t.project_id"
+        )
+        db.execute(f"INSERT INTO [{FTS_TABLE}] ([{FTS_TABLE}]) VALUES ('optimize')")
+    return db[FTS_TABLE].count
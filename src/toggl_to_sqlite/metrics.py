@@ -0,0 +1,129 @@
+"""Per-phase timing for ``fetch --metrics``.
+
+Phases are timed into :class:`Metrics`: resolving the since date, every
+HTTP request (with its status and size), JSON decoding and every insert.
+The result can be printed as a summary table or written as JSON or a
+Prometheus textfile with histograms.
+"""
+
+import collections
+import contextlib
+import json
+import threading
+import time
+from typing import Iterator
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("since", "http_request", "json_decode", "insert")
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of already sorted ``values``."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+class Metrics:
+    """Thread-safe collection of phase timings and HTTP response counters."""
+
+    def __init__(self) -> None:
+        self.timings = collections.defaultdict(list)
+        self.statuses = collections.Counter()
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def observe(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[phase].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - started)
+
+    def observe_response(self, status_code: int, seconds: float, size: int) -> None:
+        """Record one HTTP request's latency, status and body size."""
+        with self._lock:
+            self.timings["http_request"].append(seconds)
+            self.statuses[status_code] += 1
+            self.bytes_received += size
+
+    def summary(self) -> dict:
+        """Return count, total, mean, p50, p95, max and histogram buckets for each phase."""
+        with self._lock:
+            timings = {phase: sorted(values) for phase, values in self.timings.items()}
+            statuses = dict(self.statuses)
+            bytes_received = self.bytes_received
+        phases = {}
+        for phase in sorted(timings, key=lambda phase: (PHASES + (phase,)).index(phase)):
+            values = timings[phase]
+            phases[phase] = {
+                "count": len(values),
+                "sum": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "max": values[-1],
+                "buckets": {str(bound): sum(1 for value in values if value <= bound) for bound in BUCKETS},
+            }
+        return {
+            "phases": phases,
+            "http": {
+                "requests": sum(statuses.values()),
+                "bytes": bytes_received,
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            },
+        }
+
+    def table(self) -> list:
+        """Return the summary as lines of a text table."""
+        summary = self.summary()
+        lines = [f"{'phase':<14}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for phase, stats in summary["phases"].items():
+            lines.append(
+                f"{phase:<14}{stats['count']:>8}{stats['sum']:>10.2f}{stats['mean'] * 1000:>10.1f}"
+                f"{stats['p95'] * 1000:>10.1f}{stats['max'] * 1000:>10.1f}"
+            )
+        http = summary["http"]
+        statuses = ", ".join(f"{status}×{count}" for status, count in http["statuses"].items())
+        lines.append(f"{http['requests']} HTTP requests, {http['bytes'] / 1024:,.1f} KiB received ({statuses or 'none'})")
+        return lines
+
+    def prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format, e.g. for node_exporter's textfile collector."""
+        summary = self.summary()
+        lines = [
+            "# HELP toggl_to_sqlite_phase_seconds Time spent in each fetch phase.",
+            "# TYPE toggl_to_sqlite_phase_seconds histogram",
+        ]
+        for phase, stats in summary["phases"].items():
+            for bound, count in stats["buckets"].items():
+                lines.append(f'toggl_to_sqlite_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'toggl_to_sqlite_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'toggl_to_sqlite_phase_seconds_sum{{phase="{phase}"}} {stats["sum"]}')
+            lines.append(f'toggl_to_sqlite_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+        lines += [
+            "# HELP toggl_to_sqlite_http_responses_total HTTP responses received, by status code.",
+            "# TYPE toggl_to_sqlite_http_responses_total counter",
+        ]
+        for status, count in summary["http"]["statuses"].items():
+            lines.append(f'toggl_to_sqlite_http_responses_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP toggl_to_sqlite_http_response_bytes_total Bytes of HTTP response bodies received.",
+            "# TYPE toggl_to_sqlite_http_response_bytes_total counter",
+            f"toggl_to_sqlite_http_response_bytes_total {summary['http']['bytes']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write the metrics to ``path``: a Prometheus textfile if it ends in ``.prom``, JSON otherwise."""
+        with open(path, "w") as fp:
+            if str(path).endswith(".prom"):
+                fp.write(self.prometheus())
+            else:
+                json.dump(self.summary(), fp, indent=2)
@@ -0,0 +1,90 @@
+"""cProfile support for ``fetch --profile`` and the ``profile-report`` command.
+
+``cProfile`` and ``pstats`` are only imported when used, so the CLI can read
+the constants below without paying for them.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+from typing import Iterator
+
+# Environment variable that turns profiling on for scheduled runs
+PROFILE_ENV = "TOGGL_TO_SQLITE_PROFILE"
+# Packages ``profile-report`` shows by default
+REPORT_PACKAGES = ("toggl_to_sqlite", "sqlite_utils")
+SORT_KEYS = {"cumulative": "cumulative_seconds", "tottime": "own_seconds", "calls": "calls"}
+
+
+@contextlib.contextmanager
+def profile(path: str) -> Iterator[None]:
+    """Profile the calling thread and every thread it starts, dumping the merged stats to ``path`` even if the run fails.
+
+    Worker threads (``--concurrency``, the async engine's pools, ``--engine
+    reports``) do the HTTP and JSON work, so each gets its own profiler and
+    all of them are merged into one dump. From Python 3.12 one profiler
+    already sees every thread.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    threads = []
+    lock = threading.Lock()
+
+    def profile_thread(frame, event, arg):
+        # The first event in a new thread swaps this hook for a profiler of its own
+        thread_profiler = cProfile.Profile()
+        with lock:
+            threads.append(thread_profiler)
+        thread_profiler.enable()
+
+    per_thread = sys.version_info < (3, 12)
+    if per_thread:
+        threading.setprofile(profile_thread)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if per_thread:
+            threading.setprofile(None)
+        stats = pstats.Stats(profiler)
+        with lock:
+            for thread_profiler in threads:
+                stats.add(thread_profiler)
+        stats.dump_stats(path)
+
+
+def in_packages(filename: str, packages: tuple) -> bool:
+    parts = os.path.normpath(filename).split(os.sep)
+    return any(package in parts for package in packages)
+
+
+def hottest(path: str, limit: int = 20, sort: str = "cumulative", packages: tuple = REPORT_PACKAGES) -> list:
+    """The ``limit`` most expensive functions in a profile dump, optionally only those in ``packages``."""
+    import pstats
+
+    rows = []
+    for (filename, lineno, function), (_, calls, own, cumulative, _) in pstats.Stats(path).stats.items():
+        if packages and not in_packages(filename, packages):
+            continue
+        rows.append(
+            {
+                "function": f"{os.path.basename(filename)}:{lineno}({function})",
+                "calls": calls,
+                "own_seconds": own,
+                "cumulative_seconds": cumulative,
+            }
+        )
+    rows.sort(key=lambda row: row[SORT_KEYS[sort]], reverse=True)
+    return rows[:limit]
+
+
+def report(rows: list) -> list:
+    """Format :func:`hottest` rows as table lines."""
+    lines = [f"{'calls':>10}{'own s':>10}{'cumul s':>10}  function"]
+    for row in rows:
+        lines.append(f"{row['calls']:>10}{row['own_seconds']:>10.3f}{row['cumulative_seconds']:>10.3f}  {row['function']}")
+    return lines
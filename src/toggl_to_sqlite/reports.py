@@ -0,0 +1,259 @@
+"""Toggl Reports API v3 fetchers for ``fetch --engine reports`` and ``-t report_summary``.
+
+The detailed report lists every member's time entries in a workspace, not
+just the token owner's, a page at a time; each response names the next page
+in its ``X-Next-ID`` and ``X-Next-Row-Number`` headers. Its rows are
+reshaped into ``/me/time_entries`` rows so both sources fill the same
+table. The summary report gives the seconds tracked per project and user,
+fetched one calendar month at a time for the ``report_summary`` table.
+
+Workspaces are fetched side by side on a thread pool, and their pages are
+merged into one stream for a single writer.
+"""
+
+import datetime
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import requests
+import sqlite_utils
+
+from .client import TogglAPIError, TogglClient, ensure_client
+
+SUMMARY_TABLE = "report_summary"
+# The Reports API answers at most a year per request
+REPORT_WINDOW_DAYS = 366
+PAGE_SIZE = 50
+
+
+def report_windows(start: datetime.date, end: datetime.date) -> list:
+    """Split the days from ``start`` to ``end``, both included, into (first, last) ranges the API accepts."""
+    windows = []
+    while start <= end:
+        last = min(start + datetime.timedelta(days=REPORT_WINDOW_DAYS - 1), end)
+        windows.append((start, last))
+        start = last + datetime.timedelta(days=1)
+    return windows
+
+
+def month_windows(start: datetime.date, end: datetime.date) -> list:
+    """Split the calendar months from the one holding ``start`` to the one holding ``end`` into (first, last) ranges."""
+    windows = []
+    first = start.replace(day=1)
+    while first <= end:
+        following = (first + datetime.timedelta(days=32)).replace(day=1)
+        windows.append((first, following - datetime.timedelta(days=1)))
+        first = following
+    return windows
+
+
+def _utc(value: str) -> str:
+    # Reports use the member's timezone; /me/time_entries, and so the table, use UTC
+    if not value:
+        return value
+    return datetime.datetime.fromisoformat(value).astimezone(datetime.timezone.utc).isoformat()
+
+
+def _post(client: TogglClient, path: str, body: dict) -> requests.Response:
+    response = client.post(client.reports_url(path), json=body)
+    if response.status_code >= 400:
+        # Never save an error body as if it were a page of rows
+        raise TogglAPIError(f"{response.status_code} fetching report {path}", response=response)
+    return response
+
+
+def get_tag_names(client: TogglClient, workspace_id: int) -> dict:
+    """Map a workspace's tag ids to their names; the detailed report only has the ids."""
+    response = client.get(f"workspaces/{workspace_id}/tags", cache=True)
+    if response.status_code >= 400:
+        raise TogglAPIError(f"{response.status_code} fetching tags of workspace {workspace_id}", response=response)
+    return {tag["id"]: tag["name"] for tag in client.decode(response) or []}
+
+
+def entries_from_rows(rows: list, workspace_id: int, tag_names: dict) -> list:
+    """Reshape detailed report rows, each a group of entries sharing a description, into ``/me/time_entries`` rows."""
+    entries = []
+    for row in rows:
+        tag_ids = row.get("tag_ids") or []
+        for entry in row.get("time_entries") or []:
+            entries.append(
+                {
+                    "id": entry["id"],
+                    "workspace_id": workspace_id,
+                    "user_id": row.get("user_id"),
+                    "username": row.get("username"),
+                    "project_id": row.get("project_id"),
+                    "task_id": row.get("task_id"),
+                    "billable": row.get("billable"),
+                    "description": row.get("description"),
+                    "tag_ids": tag_ids,
+                    "tags": [tag_names[tag_id] for tag_id in tag_ids if tag_id in tag_names],
+                    "start": _utc(entry.get("start")),
+                    "stop": _utc(entry.get("stop")),
+                    "duration": entry.get("seconds"),
+                    "at": _utc(entry.get("at")),
+                }
+            )
+    return entries
+
+
+def get_detailed_pages(
+    client: TogglClient, workspace_id: int, start: datetime.date, end: datetime.date, page_size: int = PAGE_SIZE
+) -> Iterator[list]:
+    """Yield the time entries of every member of a workspace between two dates, both included, a page at a time."""
+    tag_names = get_tag_names(client, workspace_id)
+    for first, last in report_windows(start, end):
+        body = {"start_date": first.isoformat(), "end_date": last.isoformat(), "page_size": page_size}
+        while True:
+            response = _post(client, f"workspace/{workspace_id}/search/time_entries", body)
+            rows = client.decode(response)
+            entries = entries_from_rows(rows or [], workspace_id, tag_names)
+            if entries:
+                yield entries
+            next_id, next_row = response.headers.get("X-Next-ID"), response.headers.get("X-Next-Row-Number")
+            if not (rows and next_id and next_row):
+                break
+            body = {**body, "first_id": int(next_id), "first_row_number": int(next_row)}
+
+
+def get_summary_pages(client: TogglClient, workspace_id: int, start: datetime.date, end: datetime.date) -> Iterator[tuple]:
+    """Yield ``(workspace_id, month, rows)``: the seconds each user tracked on each project, one calendar month at a time.
+
+    Months with no time are yielded too, with no rows, so their stale rows can be removed.
+    """
+    for first, last in month_windows(start, end):
+        body = {"start_date": first.isoformat(), "end_date": last.isoformat(), "grouping": "projects", "sub_grouping": "users"}
+        data = client.decode(_post(client, f"workspace/{workspace_id}/summary/time_entries", body)) or {}
+        rows = [
+            {
+                "id": f"{workspace_id}:{first.isoformat()}:{group.get('id') or 0}:{user.get('id') or 0}",
+                "workspace_id": workspace_id,
+                "month": first.isoformat(),
+                "project_id": group.get("id"),
+                "user_id": user.get("id"),
+                "seconds": user.get("seconds"),
+            }
+            for group in data.get("groups") or []
+            for user in group.get("sub_groups") or []
+        ]
+        yield workspace_id, first.isoformat(), rows
+
+
+def merge_pages(producers: list, concurrency: int = 1) -> Iterator:
+    """Yield the pages of every producer as they arrive, running up to ``concurrency`` producers on threads.
+
+    At most ``concurrency`` pages wait in memory for the consumer. If a
+    producer fails the others are stopped and its exception is raised;
+    closing the generator early stops them too.
+    """
+    if concurrency <= 1 or len(producers) <= 1:
+        for producer in producers:
+            yield from producer()
+        return
+    pages: queue.Queue = queue.Queue(maxsize=concurrency)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(producer: Callable[[], Iterator[list]]) -> None:
+        if stop.is_set():
+            return
+        try:
+            for page in producer():
+                if not put(page):
+                    return
+        except Exception as error:
+            put(error)
+        else:
+            put(done)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(producers))) as executor:
+        for producer in producers:
+            executor.submit(run, producer)
+        try:
+            remaining = len(producers)
+            while remaining:
+                item = pages.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+
+
+def workspace_ids(client: TogglClient) -> list:
+    response = client.get("workspaces", cache=True)
+    if response.status_code >= 400:
+        raise TogglAPIError(f"{response.status_code} fetching workspaces", response=response)
+    return [workspace["id"] for workspace in client.decode(response) or []]
+
+
+def get_time_entries(
+    api_token: str,
+    start: datetime.date,
+    end: datetime.date = None,
+    client: TogglClient = None,
+    concurrency: int = 1,
+    workspaces: list = None,
+) -> Iterator[list]:
+    """Yield the time entries of every member of every workspace (or of ``workspaces``) from ``start`` to ``end``.
+
+    ``end`` defaults to today. Pages are yielded as they arrive from up to
+    ``concurrency`` workspaces at once, ready for :func:`utils.save_items`.
+    """
+    end = end or datetime.date.today()
+    with ensure_client(api_token, client, pool_size=concurrency) as client:
+        producers = [
+            functools.partial(get_detailed_pages, client, workspace_id, start, end)
+            for workspace_id in workspaces or workspace_ids(client)
+        ]
+        yield from merge_pages(producers, concurrency)
+
+
+def get_summary(
+    api_token: str,
+    start: datetime.date,
+    end: datetime.date = None,
+    client: TogglClient = None,
+    concurrency: int = 1,
+    workspaces: list = None,
+) -> Iterator[tuple]:
+    """Yield the months of :func:`get_summary_pages` for every workspace (or ``workspaces``), like :func:`get_time_entries`.
+
+    Pass them through :func:`replace_months` before saving them.
+    """
+    end = end or datetime.date.today()
+    with ensure_client(api_token, client, pool_size=concurrency) as client:
+        producers = [
+            functools.partial(get_summary_pages, client, workspace_id, start, end)
+            for workspace_id in workspaces or workspace_ids(client)
+        ]
+        yield from merge_pages(producers, concurrency)
+
+
+def replace_months(db: sqlite_utils.Database, months: Iterator[tuple]) -> Iterator[list]:
+    """Yield the rows of each month from :func:`get_summary`, first deleting the rows saved for it before.
+
+    A project or user with no time left in a month has no row in the new
+    summary, so the old one has to go. The delete is left uncommitted for
+    the writer saving the rows, so a month is only emptied once its new
+    rows have arrived, and months a failed sync never fetched are kept.
+    """
+    for workspace_id, month, rows in months:
+        if db[SUMMARY_TABLE].exists():
+            db.execute(f"DELETE FROM [{SUMMARY_TABLE}] WHERE workspace_id = ? AND month = ?", [workspace_id, month])
+        yield rows
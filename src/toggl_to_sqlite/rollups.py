@@ -0,0 +1,99 @@
+"""Rollup tables of time entry durations, kept up to date by ``fetch``.
+
+``daily_project_totals`` holds the entries and seconds per day, workspace and
+project; ``weekly_tag_totals`` the same per ISO week (keyed by its Monday),
+workspace and tag. Running entries are left out until they stop.
+
+Buckets are recomputed from ``time_entries`` rather than adjusted, so a
+refresh only needs to know which dates a sync touched: the windows recorded
+in the checkpoint table.
+"""
+
+import datetime
+
+import sqlite_utils
+
+from .utils import CHECKPOINT_TABLE
+
+DAILY_TABLE = "daily_project_totals"
+WEEKLY_TABLE = "weekly_tag_totals"
+
+DAILY_SCHEMA = {"day": str, "workspace_id": int, "project_id": int, "entries": int, "seconds": int}
+WEEKLY_SCHEMA = {"week": str, "workspace_id": int, "tag": str, "entries": int, "seconds": int}
+
+DAILY_SQL = """
+INSERT INTO [daily_project_totals] (day, workspace_id, project_id, entries, seconds)
+SELECT substr(start, 1, 10), workspace_id, project_id, count(*), sum(duration)
+FROM time_entries
+WHERE duration >= 0 AND start >= :start AND start < :end
+GROUP BY 1, 2, 3
+"""
+WEEKLY_SQL = """
+INSERT INTO [weekly_tag_totals] (week, workspace_id, tag, entries, seconds)
+SELECT date(substr(t.start, 1, 10), 'weekday 0', '-6 days'), t.workspace_id, tag.value, count(*), sum(t.duration)
+FROM time_entries t, json_each(t.tags) tag
+WHERE t.duration >= 0 AND t.start >= :start AND t.start < :end
+GROUP BY 1, 2, 3
+"""
+
+# Bounds that cover every date, for a full rebuild
+ALL_DATES = (datetime.date.min, datetime.date.max - datetime.timedelta(days=7))
+
+
+def touched_ranges(db: sqlite_utils.Database) -> list:
+    """Merge the checkpointed windows into sorted, non-overlapping (first day, last day) ranges."""
+    if CHECKPOINT_TABLE not in db.table_names():
+        return []
+    ranges = []
+    for row in db[CHECKPOINT_TABLE].rows_where(order_by="start"):
+        # Include the end date as well, in case an entry starts on it
+        start, end = datetime.date.fromisoformat(row["start"]), datetime.date.fromisoformat(row["end"])
+        if ranges and start <= ranges[-1][1] + datetime.timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def monday(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _refresh(db: sqlite_utils.Database, table: str, column: str, sql: str, ranges: list) -> int:
+    rows = 0
+    for first, last in ranges:
+        bounds = {"start": first.isoformat(), "end": (last + datetime.timedelta(days=1)).isoformat()}
+        db.execute(f"DELETE FROM [{table}] WHERE [{column}] >= :start AND [{column}] < :end", bounds)
+        rows += db.execute(sql, bounds).rowcount
+    return rows
+
+
+def refresh(db: sqlite_utils.Database, ranges: list = None) -> dict:
+    """Recompute the rollup buckets overlapping ``ranges`` of (first day, last day).
+
+    A rollup table that does not exist yet is created and built from the
+    whole of ``time_entries``, as is every table when ``ranges`` is None.
+    Returns the number of rows written to each table, leaving out tables
+    ``time_entries`` lacks the columns for.
+    """
+    if not db["time_entries"].exists():
+        return {}
+    columns = set(db["time_entries"].columns_dict)
+    written = {}
+    with db.conn:
+        for table, schema, column, sql, needs in (
+            (DAILY_TABLE, DAILY_SCHEMA, "day", DAILY_SQL, {"start", "duration", "workspace_id", "project_id"}),
+            (WEEKLY_TABLE, WEEKLY_SCHEMA, "week", WEEKLY_SQL, {"start", "duration", "workspace_id", "tags"}),
+        ):
+            if not needs <= columns:
+                continue
+            table_ranges = ranges
+            if ranges is None or not db[table].exists():
+                db[table].create(schema, if_not_exists=True)
+                db[table].create_index([column], if_not_exists=True)
+                table_ranges = [ALL_DATES]
+            if table == WEEKLY_TABLE:
+                # A touched day changes its whole week
+                table_ranges = [(monday(first), monday(last) + datetime.timedelta(days=6)) for first, last in table_ranges]
+            written[table] = _refresh(db, table, column, sql, table_ranges)
+    return written
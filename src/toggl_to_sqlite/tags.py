@@ -0,0 +1,63 @@
+"""Normalized tags for ``fetch --normalize-tags``.
+
+Time entries keep their ``tags`` JSON column. In addition, every tag name
+gets a row in ``tags`` (one per workspace), and ``time_entry_tags`` links
+entries to them. Tag queries then become indexed joins instead of
+``json_each`` scans.
+"""
+
+import json
+
+import sqlite_utils
+
+TAGS_TABLE = "tags"
+LINK_TABLE = "time_entry_tags"
+
+INSERT_TAGS_SQL = """
+INSERT OR IGNORE INTO [tags] (workspace_id, name)
+SELECT DISTINCT t.workspace_id, j.value
+FROM time_entries t, json_each(t.tags) j
+{where}
+"""
+INSERT_LINKS_SQL = """
+INSERT OR IGNORE INTO [time_entry_tags] (time_entry_id, tag_id)
+SELECT t.id, tags.id
+FROM time_entries t, json_each(t.tags) j
+JOIN tags ON tags.workspace_id IS t.workspace_id AND tags.name = j.value
+{where}
+"""
+IN_IDS = "WHERE t.id IN (SELECT value FROM json_each(:ids))"
+
+
+def ensure_tables(db: sqlite_utils.Database) -> bool:
+    """Create the tag tables if needed, linking any time entries already saved. Returns True if created."""
+    if db[LINK_TABLE].exists():
+        return False
+    with db.conn:
+        db[TAGS_TABLE].create({"id": int, "workspace_id": int, "name": str}, pk="id", if_not_exists=True)
+        db[TAGS_TABLE].create_index(["workspace_id", "name"], unique=True, if_not_exists=True)
+        db[LINK_TABLE].create(
+            {"time_entry_id": int, "tag_id": int},
+            pk=("time_entry_id", "tag_id"),
+            foreign_keys=[("tag_id", TAGS_TABLE, "id")],
+        )
+        db[LINK_TABLE].create_index(["tag_id"], if_not_exists=True)
+        if db["time_entries"].exists() and {"tags", "workspace_id"} <= set(db["time_entries"].columns_dict):
+            db.execute(INSERT_TAGS_SQL.format(where=""))
+            db.execute(INSERT_LINKS_SQL.format(where=""))
+    return True
+
+
+def link(db: sqlite_utils.Database, entries: list) -> None:
+    """Replace the links of ``entries``, just saved to ``time_entries``, without committing."""
+    ids = [entry["id"] for entry in entries]
+    unlink(db, ids)
+    if any(entry.get("tags") for entry in entries):
+        params = {"ids": json.dumps(ids)}
+        db.execute(INSERT_TAGS_SQL.format(where=IN_IDS), params)
+        db.execute(INSERT_LINKS_SQL.format(where=IN_IDS), params)
+
+
+def unlink(db: sqlite_utils.Database, ids: list) -> None:
+    """Remove the links of the time entries ``ids``, e.g. when they are deleted, without committing."""
+    db.execute(f"DELETE FROM [{LINK_TABLE}] WHERE time_entry_id IN (SELECT value FROM json_each(?))", [json.dumps(list(ids))])
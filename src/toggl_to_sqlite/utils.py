@@ -1,80 +1,584 @@
+import collections
 import datetime
+import functools
+import hashlib
+import json
 import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
 
-import requests
 import sqlite_utils
 
+from . import tags
+from .client import ResponseCache, TogglAPIError, TogglClient, ensure_client, strip_secrets
+from .metrics import Metrics
+from .writer import BulkWriter
 
-def get_start_datetime(api_token: str, since: datetime.datetime = None) -> datetime.date:
-    toggl = requests.get("https://api.track.toggl.com/api/v9/workspaces", auth=(api_token, "api_token"))
+WINDOW_FORMAT = "%Y-%m-%dT00:00:00-00:00"
+# Treat a window returning this many entries as possibly truncated by the API
+TIME_ENTRIES_RESULT_CAP = 1000
+MAX_WINDOW_DAYS = 366
+HTTP_CACHE_TABLE = "_http_cache"
+CHECKPOINT_TABLE = "time_entries_checkpoints"
+# Toggl only answers ``since`` requests for the last three months
+DELTA_MAX_AGE = datetime.timedelta(days=90)
+# Ask for a little more than changed since the last sync, in case of clock skew
+DELTA_OVERLAP = datetime.timedelta(minutes=5)
+
+
+def get_start_datetime(
+    api_token: str, since: datetime.datetime = None, client: TogglClient = None, db: sqlite_utils.Database = None
+) -> datetime.date:
+    with ensure_client(api_token, client) as client:
+        if db is not None:
+            # Revalidate the stored workspaces so the request below is answered from memory
+            fetch_if_changed(client, "workspaces", "workspaces", load_http_validators(db, client, "workspaces", "workspaces"))
+        toggl = client.get("workspaces", cache=True)
     if toggl.status_code == 200:
-        data = toggl.json()
+        data = client.decode(toggl)
         if not since:
             start_time = data[0]["at"]
             start_time = datetime.datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S+00:00")
         else:
             start_time = since
-        return start_time.date()
+        # ``since`` may already be a date, e.g. the workspace creation date from get_effective_since_date
+        return start_time.date() if isinstance(start_time, datetime.datetime) else start_time
     else:
         return datetime.date.today()
 
 
-def get_workspaces(api_token: str) -> list:
-    workspaces = []
-    response = requests.get("https://api.track.toggl.com/api/v9/workspaces", auth=(api_token, "api_token"))
-    if response.status_code == 200:
-        workspaces.append(response.json())
-        for workspace in workspaces[0]:
-            workspace.pop("api_token", None)
-    return workspaces
-
-
-def get_projects(api_token: str) -> list:
-    projects = []
-    workspaces = get_workspaces(api_token)
-    if len(workspaces) > 0:
-        for workspace in workspaces[0]:
-            response = requests.get(
-                f"https://api.track.toggl.com/api/v9/workspaces/{workspace['id']}/projects",
-                params={"active": "both"},
-                auth=(api_token, "api_token"),
-            )
-            project = response.json()
-            if project:
-                projects.append(project)
-    return projects
+def load_http_validators(
+    db: sqlite_utils.Database, client: TogglClient, path: str, table_name: str, params: dict = None, force_full: bool = False
+) -> dict:
+    """Return the ``_http_cache`` row recorded when ``path`` was last saved to ``table_name``.
+
+    Returns None under ``force_full``, or when ``table_name`` no longer
+    exists, so the response is fetched and saved again in full.
+    """
+    if force_full or table_name not in db.table_names() or HTTP_CACHE_TABLE not in db.table_names():
+        return None
+    key = ResponseCache.key(client.url(path), params)
+    rows = list(db[HTTP_CACHE_TABLE].rows_where("key = ? and table_name = ?", [key, table_name]))
+    return rows[0] if rows else None
+
+
+def fetch_if_changed(client: TogglClient, path: str, table_name: str, stored: dict = None, params: dict = None) -> tuple:
+    """Fetch ``path`` conditionally, returning ``(data, validators)``.
+
+    ``stored`` is the row from :func:`load_http_validators`; its ETag and
+    Last-Modified are sent back to the server, unless this client already
+    fetched ``path`` during the run. When the server answers 304 or returns
+    identical content the stored body is returned with ``validators`` set
+    to None. Otherwise ``validators`` is the row to pass to
+    :func:`save_http_validators` once the data has been saved. API tokens
+    are stripped before hashing.
+    """
+    key = ResponseCache.key(client.url(path), params)
+    cache_key = client.cache_key(path, params)
+    response = client.cache.get(cache_key)
+    if response is None:
+        headers = {}
+        if stored and stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored and stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+        response = client.get(path, params=params, headers=headers)
+        if response.status_code == 304:
+            data = json.loads(stored["body"])
+            client.cache.set(cache_key, data, {"ETag": stored["etag"], "Last-Modified": stored["last_modified"]})
+            return data, None
+        if response.status_code != 200:
+            return None, None
+        data = strip_secrets(client.decode(response))
+        client.cache.set(
+            cache_key, data, {"ETag": response.headers.get("ETag"), "Last-Modified": response.headers.get("Last-Modified")}
+        )
+    else:
+        data = response.json()
+
+    body = json.dumps(data, sort_keys=True)
+    content_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    if stored and stored["content_hash"] == content_hash:
+        return data, None
+    return data, {
+        "key": key,
+        "table_name": table_name,
+        "url": client.url(path),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+        "body": body,
+        "fetched_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def get_if_changed(
+    client: TogglClient,
+    path: str,
+    table_name: str,
+    db: sqlite_utils.Database,
+    params: dict = None,
+    force_full: bool = False,
+) -> tuple:
+    """Fetch ``path`` conditionally against the validators stored in ``db``, see :func:`fetch_if_changed`."""
+    stored = load_http_validators(db, client, path, table_name, params, force_full=force_full)
+    return fetch_if_changed(client, path, table_name, stored, params)
+
+
+def save_http_validators(db: sqlite_utils.Database, validators: dict) -> None:
+    db[HTTP_CACHE_TABLE].insert(validators, pk=("key", "table_name"), replace=True, alter=True)
+
+
+def get_workspaces(
+    api_token: str, client: TogglClient = None, db: sqlite_utils.Database = None, force_full: bool = False
+) -> Iterator[list]:
+    """Yield the list of workspaces (a single page) once it has been fetched.
+
+    With ``db`` the request is conditional and nothing is yielded when the
+    workspaces are unchanged since they were last saved, unless ``force_full``.
+    """
+    with ensure_client(api_token, client) as client:
+        if db is not None:
+            workspaces, validators = get_if_changed(client, "workspaces", "workspaces", db, force_full=force_full)
+            if validators:
+                yield workspaces
+                save_http_validators(db, validators)
+            return
+        response = client.get("workspaces", cache=True)
+        if response.status_code == 200:
+            yield strip_secrets(client.decode(response))
+
+
+def get_projects(
+    api_token: str, client: TogglClient = None, db: sqlite_utils.Database = None, force_full: bool = False
+) -> Iterator[list]:
+    """Yield each workspace's projects as they arrive.
+
+    With ``db`` each request is conditional and workspaces whose projects
+    are unchanged since they were last saved are skipped, unless ``force_full``.
+    """
+    with ensure_client(api_token, client) as client:
+        if db is not None:
+            workspaces, validators = get_if_changed(client, "workspaces", "projects", db, force_full=force_full)
+            if validators:
+                save_http_validators(db, validators)
+            for workspace in workspaces or []:
+                path = f"workspaces/{workspace['id']}/projects"
+                project, validators = get_if_changed(client, path, "projects", db, {"active": "both"}, force_full=force_full)
+                if validators:
+                    if project:
+                        yield project
+                    save_http_validators(db, validators)
+            return
+        for workspaces in get_workspaces(api_token, client=client):
+            for workspace in workspaces:
+                response = client.get(f"workspaces/{workspace['id']}/projects", params={"active": "both"}, cache=True)
+                project = client.decode(response)
+                if project:
+                    yield project
 
 
-def get_time_entries(api_token: str, days: int, since: datetime.datetime = None) -> list:
-    start_date = get_start_datetime(api_token, since)
+def get_time_entry_windows(start_date: datetime.date, days: int) -> list:
+    """Split the range from ``start_date`` to today into ``days``-sized (start, end) windows."""
     today = datetime.date.today()
-    data = []
+    windows = []
     if days > 0:
         cycles = math.ceil((today - start_date).days / days)
         for cycle in range(cycles):
-            _start_date = (start_date + datetime.timedelta(days=days) * cycle).strftime("%Y-%m-%dT00:00:00-00:00")
-            _end_date = (start_date + datetime.timedelta(days=days) * (cycle + 1)).strftime("%Y-%m-%dT00:00:00-00:00")
-            params = (
-                ("start_date", _start_date),
-                ("end_date", _end_date),
-            )
-            response = requests.get(
-                "https://api.track.toggl.com/api/v9/me/time_entries",
-                params=params,
-                auth=(api_token, "api_token"),
+            _start_date = (start_date + datetime.timedelta(days=days) * cycle).strftime(WINDOW_FORMAT)
+            _end_date = (start_date + datetime.timedelta(days=days) * (cycle + 1)).strftime(WINDOW_FORMAT)
+            windows.append((_start_date, _end_date))
+    return windows
+
+
+def window_dates(window: tuple) -> tuple:
+    """Return the (start, end) dates of a window from :func:`get_time_entry_windows`."""
+    return tuple(datetime.date.fromisoformat(value[:10]) for value in window)
+
+
+def get_time_entries_window(client: TogglClient, window: tuple) -> list:
+    start_date, end_date = window
+    params = (
+        ("start_date", start_date),
+        ("end_date", end_date),
+    )
+    response = client.get("me/time_entries", params=params)
+    if response.status_code >= 400:
+        # Never save an error body as if it were a page of entries
+        raise TogglAPIError(f"{response.status_code} fetching time entries {start_date} to {end_date}", response=response)
+    return client.decode(response)
+
+
+def _fetch_time_entries_span(client: TogglClient, start: datetime.date, end: datetime.date, truncated: list = None) -> list:
+    """Fetch entries between two dates, splitting the span when a response may have been truncated.
+
+    A single day can not be split further; if it still comes back at the cap,
+    its (start, end) is appended to ``truncated`` when given.
+    """
+    entries = get_time_entries_window(client, (start.strftime(WINDOW_FORMAT), end.strftime(WINDOW_FORMAT)))
+    if isinstance(entries, list) and len(entries) >= TIME_ENTRIES_RESULT_CAP:
+        if (end - start).days > 1:
+            middle = start + (end - start) // 2
+            return _fetch_time_entries_span(client, start, middle, truncated) + _fetch_time_entries_span(
+                client, middle, end, truncated
             )
-            data.append(response.json())
+        if truncated is not None:
+            truncated.append((start, end))
+    return entries
+
+
+class WindowSizer:
+    """Choose the next time entry window size from how full previous responses were."""
+
+    def __init__(self, days: int, min_days: int = 1, max_days: int = MAX_WINDOW_DAYS) -> None:
+        self.min_days = min_days
+        self.max_days = max_days
+        self.days = min(max(days, min_days), max_days)
+
+    def observe(self, days: int, entries: int) -> int:
+        if entries >= TIME_ENTRIES_RESULT_CAP * 0.75:
+            self.days = max(self.min_days, min(self.days, days // 2))
+        elif entries < TIME_ENTRIES_RESULT_CAP * 0.25:
+            self.days = min(self.max_days, max(self.days, days * 2))
+        return self.days
+
+
+def get_adaptive_window_days(db: sqlite_utils.Database) -> int:
+    """Return the window size the last adaptive sync settled on, if any."""
+    if "time_entries_windows" not in db.table_names():
+        return None
+    rows = list(db["time_entries_windows"].rows_where(order_by="start desc", limit=1))
+    return rows[0]["next_days"] if rows else None
+
+
+def record_time_entry_window(
+    db: sqlite_utils.Database, start: datetime.date, end: datetime.date, entries: int, next_days: int
+) -> None:
+    db["time_entries_windows"].insert(
+        {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "days": (end - start).days,
+            "entries": entries,
+            "next_days": next_days,
+        },
+        pk="start",
+        replace=True,
+        alter=True,
+    )
+
+
+def record_checkpoint(db: sqlite_utils.Database, start: datetime.date, end: datetime.date, entries: list) -> None:
+    """Record that the window from ``start`` to ``end`` has been saved.
+
+    Inserting the checkpoint commits the open transaction, so the window's
+    rows and its checkpoint are committed together.
+    """
+    db[CHECKPOINT_TABLE].insert(
+        {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "rows": len(entries),
+            "hash": hashlib.sha256(json.dumps(entries, sort_keys=True).encode("utf-8")).hexdigest(),
+            "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        pk="start",
+        replace=True,
+        alter=True,
+    )
 
-    return data
 
+def get_resume_date(db: sqlite_utils.Database, start_date: datetime.date) -> datetime.date:
+    """Return the date up to which windows from ``start_date`` have been checkpointed without gaps."""
+    resume_date = start_date
+    if CHECKPOINT_TABLE not in db.table_names():
+        return resume_date
+    for row in db[CHECKPOINT_TABLE].rows_where(order_by="start"):
+        start, end = datetime.date.fromisoformat(row["start"]), datetime.date.fromisoformat(row["end"])
+        if start > resume_date:
+            break
+        resume_date = max(resume_date, end)
+    return resume_date
 
-def save_items(items: list, table: str, db: sqlite_utils.Database) -> None:
-    for item in items:
-        data = item
-        try:
-            db[table].insert_all(data, pk="id", alter=True, replace=True)
-        except AttributeError:
-            print(item)
+
+def clear_checkpoints(db: sqlite_utils.Database) -> None:
+    """Forget every checkpoint, once a sync has finished or a full sync is requested."""
+    if CHECKPOINT_TABLE in db.table_names():
+        with db.conn:
+            db[CHECKPOINT_TABLE].delete_where()
+
+
+def get_adaptive_time_entries(
+    client: TogglClient,
+    start_date: datetime.date,
+    days: int,
+    concurrency: int = 1,
+    db: sqlite_utils.Database = None,
+) -> Iterator[list]:
+    """Yield time entries in windows sized from how busy the previous windows were.
+
+    Windows grow while responses are small and shrink as they approach
+    ``TIME_ENTRIES_RESULT_CAP``; a response at the cap is refetched in halves.
+    Each window is recorded in ``time_entries_windows`` once it has been saved.
+    """
+    sizer = WindowSizer(days)
+    today = datetime.date.today()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = collections.deque()
+        start = start_date
+        while start < today or pending:
+            while start < today and len(pending) < concurrency:
+                end = start + datetime.timedelta(days=sizer.days)
+                if end >= today:
+                    end = today + datetime.timedelta(days=1)
+                pending.append((start, end, executor.submit(_fetch_time_entries_span, client, start, end)))
+                start = end
+            window_start, window_end, future = pending.popleft()
+            entries = future.result()
+            sizer.observe((window_end - window_start).days, len(entries))
+            yield entries
+            if db is not None:
+                record_time_entry_window(db, window_start, window_end, len(entries), sizer.days)
+                record_checkpoint(db, window_start, window_end, entries)
+
+
+def _fetch_time_entry_windows(
+    client: TogglClient, windows: list, concurrency: int = 1, fetch: Callable = get_time_entries_window
+) -> Iterator[tuple]:
+    """Yield ``(window, fetch(client, window))`` in order, fetching up to ``concurrency`` windows at once."""
+    if concurrency > 1 and len(windows) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = collections.deque()
+            for window in windows:
+                pending.append((window, executor.submit(fetch, client, window)))
+                if len(pending) >= concurrency:
+                    window, future = pending.popleft()
+                    yield window, future.result()
+            while pending:
+                window, future = pending.popleft()
+                yield window, future.result()
+    else:
+        for window in windows:
+            yield window, fetch(client, window)
+
+
+def get_time_entries(
+    api_token: str,
+    days: int,
+    since: datetime.datetime = None,
+    client: TogglClient = None,
+    concurrency: int = 1,
+    adaptive: bool = False,
+    db: sqlite_utils.Database = None,
+) -> Iterator[list]:
+    """Yield time entries window by window, in chronological order.
+
+    With ``concurrency`` greater than one, windows are fetched on a bounded
+    thread pool; the client's rate limiter keeps the pool under Toggl's limit.
+    At most ``concurrency`` windows are held in memory at any time.
+
+    With ``adaptive`` the window size starts at ``days`` (or the size recorded
+    in ``db`` by the previous adaptive sync) and adjusts as windows arrive.
+
+    With ``db`` each window is checkpointed in ``time_entries_checkpoints``
+    once it has been saved, and windows already checkpointed by an
+    interrupted sync are skipped.
+    """
+    with ensure_client(api_token, client) as client:
+        start_date = get_start_datetime(api_token, since, client=client, db=db)
+        resume_date = get_resume_date(db, start_date) if db is not None else start_date
+        if adaptive:
+            if db is not None:
+                days = get_adaptive_window_days(db) or days
+            yield from get_adaptive_time_entries(client, resume_date, days, concurrency=concurrency, db=db)
+            return
+        windows = [window for window in get_time_entry_windows(start_date, days) if window_dates(window)[1] > resume_date]
+        for window, entries in _fetch_time_entry_windows(client, windows, concurrency):
+            yield entries
+            if db is not None:
+                record_checkpoint(db, *window_dates(window), entries)
+
+
+def local_window_versions(db: sqlite_utils.Database, start: datetime.date, end: datetime.date) -> dict:
+    """Map the id of every saved time entry starting in ``[start, end)`` to its ``at`` timestamp."""
+    if not db["time_entries"].exists():
+        return {}
+    at = "at" if "at" in db["time_entries"].columns_dict else "NULL"
+    sql = f"SELECT id, {at} FROM time_entries WHERE start >= ? AND start < ?"
+    return dict(db.execute(sql, [start.isoformat(), end.isoformat()]).fetchall())
+
+
+def reconcile_time_entries(
+    api_token: str,
+    db: sqlite_utils.Database,
+    days: int,
+    since: datetime.datetime = None,
+    client: TogglClient = None,
+    concurrency: int = 1,
+    metrics: Metrics = None,
+) -> dict:
+    """Make the saved time entries from ``since`` (default: all of them) match Toggl, window by window.
+
+    Each window's ids and ``at`` timestamps are compared with the rows saved
+    for the same dates. Windows that match are not written at all; for the
+    others only new or changed entries are saved, entries no longer in Toggl
+    are deleted, and the window is checkpointed so rollups are refreshed.
+
+    Windows coming back at ``TIME_ENTRIES_RESULT_CAP`` are refetched in
+    smaller spans. If a single day is still at the cap, the response may be
+    missing entries, so nothing in that window is deleted.
+    Returns counts of windows checked, changed and truncated, and rows saved and deleted.
+    """
+    stats = {"windows": 0, "windows_changed": 0, "windows_truncated": 0, "rows": 0, "deleted": 0}
+
+    def fetch(client, window):
+        truncated = []
+        return _fetch_time_entries_span(client, *window_dates(window), truncated=truncated), bool(truncated)
+
+    with ensure_client(api_token, client) as client:
+        start_date = get_start_datetime(api_token, since, client=client, db=db)
+        writer = get_writer(db, "time_entries", metrics=metrics)
+        windows = get_time_entry_windows(start_date, days)
+        for window, (entries, truncated) in _fetch_time_entry_windows(client, windows, concurrency, fetch=fetch):
+            stats["windows"] += 1
+            stats["windows_truncated"] += truncated
+            local = local_window_versions(db, *window_dates(window))
+            changed = [entry for entry in entries if entry["id"] not in local or local[entry["id"]] != entry.get("at")]
+            # Missing from a possibly truncated response does not mean deleted in Toggl
+            deleted = set() if truncated else local.keys() - {entry["id"] for entry in entries}
+            if not changed and not deleted:
+                continue
+            writer.write(changed)
+            if deleted:
+                ids = json.dumps(sorted(deleted))
+                db.execute("DELETE FROM time_entries WHERE id IN (SELECT value FROM json_each(?))", [ids])
+                if db[tags.LINK_TABLE].exists():
+                    tags.unlink(db, sorted(deleted))
+            # Commits the window's changes together with its checkpoint
+            record_checkpoint(db, *window_dates(window), entries)
+            stats["windows_changed"] += 1
+            stats["rows"] += len(changed)
+            stats["deleted"] += len(deleted)
+        writer.close()
+    return stats
+
+
+def get_delta_since(db: sqlite_utils.Database, now: datetime.datetime = None) -> datetime.datetime:
+    """The time to ask for time entries modified since, or None if a delta sync is not possible.
+
+    That is the case before the first sync, and when the last one is older
+    than :data:`DELTA_MAX_AGE`.
+    """
+    last_sync = get_last_sync_time(db, "time_entries")
+    if last_sync is None:
+        return None
+    if last_sync.tzinfo is None:
+        last_sync = last_sync.replace(tzinfo=datetime.timezone.utc)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if now - last_sync > DELTA_MAX_AGE - DELTA_OVERLAP:
+        return None
+    return last_sync - DELTA_OVERLAP
+
+
+def get_time_entries_delta(client: TogglClient, since: datetime.datetime) -> list:
+    """Time entries created, changed or deleted since ``since``, in one request."""
+    response = client.get("me/time_entries", params=(("since", int(since.timestamp())),))
+    if response.status_code >= 400:
+        raise TogglAPIError(f"{response.status_code} fetching time entries modified since {since.isoformat()}", response=response)
+    return client.decode(response)
+
+
+def save_time_entries_delta(
+    api_token: str,
+    db: sqlite_utils.Database,
+    since: datetime.datetime,
+    client: TogglClient = None,
+    metrics: Metrics = None,
+    normalize_tags: bool = False,
+) -> dict:
+    """Apply the time entries modified since ``since`` to ``db``: upsert live ones, delete deleted ones.
+
+    Returns the writer statistics plus ``deleted``, the number of rows
+    deleted, and ``days``, the sorted start dates (old and new) of every
+    entry touched, for :func:`rollups.refresh`.
+    """
+    with ensure_client(api_token, client) as client:
+        entries = get_time_entries_delta(client, since)
+    deleted = [entry["id"] for entry in entries if entry.get("server_deleted_at")]
+    live = [entry for entry in entries if not entry.get("server_deleted_at")]
+    ids = json.dumps([entry["id"] for entry in entries])
+    days = {entry["start"][:10] for entry in live if entry.get("start")}
+    if db["time_entries"].exists():
+        # Entries moved to another day, or deleted, also change the day they used to be on
+        sql = "SELECT start FROM time_entries WHERE id IN (SELECT value FROM json_each(?))"
+        days |= {row[0][:10] for row in db.execute(sql, [ids]) if row[0]}
+    writer = get_writer(db, "time_entries", metrics=metrics, normalize_tags=normalize_tags)
+    writer.write(live)
+    count = 0
+    if deleted and db["time_entries"].exists():
+        count = db.execute(
+            "DELETE FROM time_entries WHERE id IN (SELECT value FROM json_each(?))", [json.dumps(deleted)]
+        ).rowcount
+        if db[tags.LINK_TABLE].exists():
+            tags.unlink(db, deleted)
+    stats = writer.close()
+    return {**stats, "deleted": count, "days": [datetime.date.fromisoformat(day) for day in sorted(days)]}
+
+
+def get_writer(
+    db: sqlite_utils.Database,
+    table: str,
+    batch_size: int = None,
+    metrics: Metrics = None,
+    normalize_tags: bool = False,
+    skip_unchanged: bool = True,
+) -> BulkWriter:
+    """A :class:`BulkWriter` for ``table``, keeping the tag tables in step with ``time_entries``.
+
+    ``normalize_tags`` creates the tag tables if needed; once they exist the
+    links are maintained on every write, with or without it.
+    """
+    on_write = None
+    if table == "time_entries" and (normalize_tags or db[tags.LINK_TABLE].exists()):
+        tags.ensure_tables(db)
+        on_write = functools.partial(tags.link, db)
+    return BulkWriter(db, table, batch_size=batch_size, metrics=metrics, on_write=on_write, skip_unchanged=skip_unchanged)
+
+
+def save_items(
+    items: Iterable[list],
+    table: str,
+    db: sqlite_utils.Database,
+    batch_size: int = None,
+    writer: BulkWriter = None,
+    metrics: Metrics = None,
+    normalize_tags: bool = False,
+    skip_unchanged: bool = True,
+) -> dict:
+    """Save each page of ``items`` as it is produced, so generators are consumed incrementally.
+
+    Rows are written by a :class:`BulkWriter`. Pass ``writer`` to share one
+    writer, and so one transaction, across several calls; it is then left
+    open for the caller to close. With ``normalize_tags``, time entries are
+    also linked to the ``tags`` table (see :func:`get_writer`). Rows that
+    match the stored ones are skipped unless ``skip_unchanged`` is False.
+    Returns the writer's statistics, including rows written and skipped.
+    """
+    own_writer = writer is None
+    writer = writer or get_writer(
+        db, table, batch_size=batch_size, metrics=metrics, normalize_tags=normalize_tags, skip_unchanged=skip_unchanged
+    )
+    try:
+        for item in items:
+            data = item
+            try:
+                writer.write(data)
+            except AttributeError:
+                print(item)
+    finally:
+        if own_writer:
+            writer.close()
+    return writer.stats()
 
 
 def get_last_sync_time(db: sqlite_utils.Database, table_name: str) -> datetime.datetime:
@@ -103,7 +607,11 @@ def update_sync_time(db: sqlite_utils.Database, table_name: str, sync_time: date
 
 
 def get_effective_since_date(
-    api_token: str, table_name: str, db: sqlite_utils.Database, user_since: datetime.datetime = None
+    api_token: str,
+    table_name: str,
+    db: sqlite_utils.Database,
+    user_since: datetime.datetime = None,
+    client: TogglClient = None,
 ) -> datetime.datetime:
     """Get the effective 'since' date to use for fetching data.
 
@@ -121,4 +629,4 @@ def get_effective_since_date(
         return last_sync
 
     # Fallback to workspace creation date
-    return get_start_datetime(api_token)
+    return get_start_datetime(api_token, client=client, db=db)
@@ -0,0 +1,162 @@
+import json
+import time
+from typing import Callable
+
+import sqlite_utils
+from sqlite_utils.db import jsonify_if_needed
+from sqlite_utils.utils import suggest_column_types
+
+from .metrics import Metrics
+
+
+class BulkWriter:
+    """Upsert rows into one table using explicit transactions.
+
+    Without a ``batch_size`` everything written is committed when the writer
+    is closed, or when something else commits the shared connection first;
+    otherwise a commit also happens every ``batch_size`` rows. Syncs that
+    checkpoint time entry windows commit each window together with its
+    checkpoint (see :func:`utils.record_checkpoint`), so for those time
+    entries ``batch_size`` only matters for windows larger than it.
+    The table schema is read once, on the first write. After that only
+    columns that have not been seen before trigger an ``ALTER TABLE``.
+    With ``metrics`` the time taken by every insert is recorded. ``on_write``
+    is called with each chunk of rows right after it is inserted, in the same
+    transaction, to keep derived tables in step.
+
+    With ``skip_unchanged`` rows identical to the stored row are not written:
+    rows with an ``at`` (last modified) timestamp are compared on it alone,
+    others on every column they have. Rows with a column this writer had to
+    add are always written, so the new column gets filled in.
+    """
+
+    def __init__(
+        self,
+        db: sqlite_utils.Database,
+        table: str,
+        batch_size: int = None,
+        pk: str = "id",
+        metrics: Metrics = None,
+        on_write: Callable[[list], None] = None,
+        skip_unchanged: bool = True,
+    ) -> None:
+        self.db = db
+        self.table = table
+        self.batch_size = batch_size
+        self.pk = pk
+        self.metrics = metrics
+        self.on_write = on_write
+        self.skip_unchanged = skip_unchanged
+        self.columns = None
+        # Columns added to an existing table by this writer, and whether there were rows to compare with
+        self.added_columns = set()
+        self.existed = False
+        self.rows = 0
+        self.written = 0
+        self.skipped = 0
+        self.uncommitted = 0
+        self.seconds = 0.0
+
+    def _ensure_columns(self, rows: list) -> None:
+        if self.columns is None:
+            table = self.db[self.table]
+            if table.exists():
+                self.columns = set(table.columns_dict)
+                self.existed = True
+            else:
+                column_types = suggest_column_types(rows)
+                table.create(column_types, pk=self.pk)
+                self.columns = set(column_types)
+        new_columns = {key for row in rows for key in row} - self.columns
+        if new_columns:
+            column_types = suggest_column_types(rows)
+            for column in sorted(new_columns):
+                self.db[self.table].add_column(column, column_types[column])
+            self.columns |= new_columns
+            if self.existed:
+                self.added_columns |= new_columns
+
+    def _comparable(self, row: dict) -> bool:
+        return row.get(self.pk) is not None and not self.added_columns & row.keys()
+
+    def _changed(self, rows: list) -> list:
+        """Leave out the rows that match what is stored."""
+        compared = [row for row in rows if self._comparable(row)]
+        if not compared:
+            return rows
+        if "at" in self.columns and all(row.get("at") is not None for row in compared):
+            columns = ["at"]
+        else:
+            columns = sorted({key for row in compared for key in row} - {self.pk})
+        sql = "SELECT [{pk}], {columns} FROM [{table}] WHERE [{pk}] IN (SELECT value FROM json_each(?))".format(
+            pk=self.pk, columns=", ".join(f"[{column}]" for column in columns) or "NULL", table=self.table
+        )
+        ids = json.dumps([row[self.pk] for row in compared])
+        stored = {values[0]: values[1:] for values in self.db.execute(sql, [ids])}
+
+        def unchanged(row):
+            values = stored.get(row.get(self.pk))
+            return (
+                values is not None
+                and self._comparable(row)
+                and all(jsonify_if_needed(row.get(column)) == value for column, value in zip(columns, values))
+            )
+
+        return [row for row in rows if not unchanged(row)]
+
+    def _insert(self, rows: list) -> None:
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        sql = "INSERT OR REPLACE INTO [{table}] ({columns}) VALUES ({placeholders})".format(
+            table=self.table,
+            columns=", ".join(f"[{column}]" for column in columns),
+            placeholders=", ".join("?" for _ in columns),
+        )
+        self.db.conn.executemany(sql, ([jsonify_if_needed(row.get(column)) for column in columns] for row in rows))
+        self.written += len(rows)
+        self.uncommitted += len(rows)
+
+    def write(self, rows: list) -> None:
+        """Upsert ``rows``, a list of dicts, committing whenever a batch fills up."""
+        # Touch every row first so a bad page raises before anything is written
+        rows = [row for row in rows if row.keys()]
+        if not rows:
+            return
+        started = time.perf_counter()
+        self._ensure_columns(rows)
+        received = len(rows)
+        if self.skip_unchanged and self.existed:
+            rows = self._changed(rows)
+        self.rows += received
+        self.skipped += received - len(rows)
+        while rows:
+            room = self.batch_size - self.uncommitted if self.batch_size else len(rows)
+            inserted = time.perf_counter()
+            self._insert(rows[:room])
+            if self.on_write is not None:
+                self.on_write(rows[:room])
+            if self.metrics is not None:
+                self.metrics.observe("insert", time.perf_counter() - inserted)
+            rows = rows[room:]
+            if self.batch_size and self.uncommitted >= self.batch_size:
+                self.commit()
+        self.seconds += time.perf_counter() - started
+
+    def commit(self) -> None:
+        self.db.conn.commit()
+        self.uncommitted = 0
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows,
+            "written": self.written,
+            "skipped": self.skipped,
+            "seconds": self.seconds,
+            "rows_per_second": self.rows / self.seconds if self.seconds else 0.0,
+        }
+
+    def close(self) -> dict:
+        """Commit anything outstanding and return the writer's statistics."""
+        started = time.perf_counter()
+        self.commit()
+        self.seconds += time.perf_counter() - started
+        return self.stats()
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    """Retry backoff and rate limiting should not slow the test suite down."""
+    monkeypatch.setattr("toggl_to_sqlite.client.time.sleep", lambda seconds: None)
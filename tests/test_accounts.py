@@ -0,0 +1,108 @@
+"""Tests for syncing many accounts with fetch-many."""
+
+import base64
+import json
+import re
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import accounts
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL
+
+
+def token(request):
+    return base64.b64decode(request.headers["Authorization"].split()[1]).decode().split(":")[0]
+
+
+@pytest.fixture
+def remote(requests_mock):
+    """Serve one workspace and one time entry per token; the token ``bad`` fails to list its entries."""
+    ids = {"alice": 1, "bob": 2, "carol": 3, "bad": 4}
+
+    def workspaces(request, context):
+        return [{"id": ids[token(request)], "at": "2024-01-01T00:00:00+00:00"}]
+
+    def time_entries(request, context):
+        if token(request) == "bad":
+            context.status_code = 500
+            return {}
+        entry_id = ids[token(request)]
+        return [
+            {"id": entry_id, "workspace_id": entry_id, "project_id": None, "start": "2024-01-02T09:00:00+00:00", "duration": 60}
+        ]
+
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=workspaces)
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=time_entries)
+    requests_mock.get(re.compile(rf"{API_BASE_URL}/workspaces/\d+/projects"), json=[])
+    return requests_mock
+
+
+def write_config(tmp_path, listed):
+    (tmp_path / "alice.json").write_text(json.dumps({"api_token": "alice"}))
+    config = tmp_path / "accounts.json"
+    config.write_text(json.dumps({"accounts": listed}))
+    return str(config)
+
+
+def test_load_config_resolves_paths(tmp_path):
+    config = write_config(
+        tmp_path, [{"auth": "alice.json", "db": "alice.db"}, {"api_token": "bob", "db": "bob.db", "name": "Bob"}]
+    )
+
+    listed = accounts.load_config(config)
+
+    assert [(account["name"], account["api_token"], account["db"]) for account in listed] == [
+        ("alice.db", "alice", str(tmp_path / "alice.db")),
+        ("Bob", "bob", str(tmp_path / "bob.db")),
+    ]
+    assert listed[0]["types"] == ("time_entries", "workspaces", "projects")
+
+    with pytest.raises(ValueError):
+        accounts.load_config(write_config(tmp_path, [{"api_token": "bob"}]))
+    with pytest.raises(ValueError):
+        accounts.load_config(write_config(tmp_path, [{"api_token": "bob", "db": "a.db"}, {"api_token": "carol", "db": "./a.db"}]))
+    with pytest.raises(ValueError, match="report_summary"):
+        accounts.load_config(
+            write_config(tmp_path, [{"api_token": "bob", "db": "a.db", "types": ["time_entries", "report_summary"]}])
+        )
+
+
+def test_accounts_sync_side_by_side(tmp_path, remote):
+    config = write_config(
+        tmp_path,
+        [
+            {"auth": "alice.json", "db": "alice.db", "types": ["time_entries", "workspaces"]},
+            {"api_token": "bob", "db": "bob.db", "types": ["time_entries"]},
+            {"api_token": "carol", "db": "carol.db", "types": ["time_entries"]},
+        ],
+    )
+    done = []
+
+    results = accounts.fetch_many(accounts.load_config(config), concurrency=2, on_done=lambda account, _: done.append(account))
+
+    assert sorted(account["api_token"] for account in done) == ["alice", "bob", "carol"]
+    assert [result["saved"]["time_entries"]["rows"] for result in results] == [1, 1, 1]
+    alice, carol = sqlite_utils.Database(tmp_path / "alice.db"), sqlite_utils.Database(tmp_path / "carol.db")
+    assert [row["id"] for row in alice["workspaces"].rows] == [1]
+    assert [row["id"] for row in carol["time_entries"].rows] == [3]
+    assert carol["time_entries_since"].exists() and carol["daily_project_totals"].exists()
+    # Every token was sent on its own requests
+    assert {token(request) for request in remote.request_history} == {"alice", "bob", "carol"}
+
+
+def test_cli_fetch_many_reports_failed_accounts(tmp_path, remote):
+    config = write_config(
+        tmp_path, [{"auth": "alice.json", "db": "alice.db"}, {"api_token": "bad", "db": "bad.db", "name": "Bad"}]
+    )
+
+    result = CliRunner().invoke(cli, ["fetch-many", config, "--rate-limit", "0", "--max-retries", "0"])
+
+    assert result.exit_code == 1
+    assert "👥 Syncing 2 accounts into 2 databases, 4 requests at a time" in result.output
+    assert "💾 Saved 1 time_entries" in result.output
+    assert "❌ Bad: 500 fetching time entries" in result.output
+    assert "1 of 2 accounts failed" in result.output
+    assert [row["id"] for row in sqlite_utils.Database(tmp_path / "alice.db")["time_entries"].rows] == [1]
@@ -0,0 +1,36 @@
+"""Import-time regression tests for CLI startup."""
+
+import subprocess
+import sys
+
+import pytest
+
+# Microseconds ``toggl_to_sqlite.cli`` may take to import, including click.
+# Importing requests and sqlite-utils as well takes several times longer.
+IMPORT_BUDGET_US = 150_000
+HEAVY_MODULES = {"requests", "urllib3", "sqlite_utils", "sqlite3", "asyncio"}
+
+
+def import_times(*args) -> dict:
+    """Run the CLI under ``python -X importtime``, returning cumulative microseconds per module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from toggl_to_sqlite.cli import cli; cli()", *args],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, module = line.removeprefix("import time:").split("|")
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("args", [["--help"], ["--version"], ["auth", "--help"], ["fetch", "--help"], ["fetch-many", "--help"]])
+def test_cli_starts_without_heavy_imports(args):
+    times = import_times(*args)
+
+    assert not HEAVY_MODULES & set(times)
+    assert times["toggl_to_sqlite.cli"] < IMPORT_BUDGET_US
@@ -0,0 +1,359 @@
+"""Tests for the pooled Toggl HTTP client."""
+
+import base64
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import (
+    API_BASE_URL,
+    ResponseCache,
+    TogglAPIError,
+    TogglClient,
+    TokenBucket,
+    get_token_bucket,
+    parse_retry_after,
+)
+from toggl_to_sqlite.utils import get_projects, get_start_datetime, get_time_entries_window, get_workspaces
+
+
+def test_url_is_relative_to_base_url():
+    client = TogglClient("token")
+    assert client.url("workspaces") == f"{API_BASE_URL}/workspaces"
+    assert client.url("/me/time_entries") == f"{API_BASE_URL}/me/time_entries"
+    assert client.url("https://example.com/x") == "https://example.com/x"
+
+
+def test_session_sends_auth_and_default_headers(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[])
+    with TogglClient("secret") as client:
+        client.get("workspaces")
+
+    headers = requests_mock.last_request.headers
+    expected = base64.b64encode(b"secret:api_token").decode()
+    assert headers["Authorization"] == f"Basic {expected}"
+    assert headers["Accept"] == "application/json"
+    assert headers["User-Agent"].startswith("toggl-to-sqlite/")
+
+
+def test_pool_is_sized_to_pool_size():
+    client = TogglClient("token", pool_size=4)
+    assert client.adapter._pool_maxsize == 4
+    assert client.session.get_adapter(API_BASE_URL) is client.adapter
+
+
+def test_fetchers_share_one_client(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1}, {"id": 2}])
+    requests_mock.get(f"{API_BASE_URL}/workspaces/1/projects", json=[{"id": 10}])
+    requests_mock.get(f"{API_BASE_URL}/workspaces/2/projects", json=[{"id": 20}])
+
+    client = TogglClient("token")
+    projects = list(get_projects("token", client=client))
+
+    assert projects == [[{"id": 10}], [{"id": 20}]]
+    assert client.stats()["requests"] == 3
+
+
+def test_stats_report_connection_reuse():
+    client = TogglClient("token")
+
+    class FakePool:
+        num_connections = 1
+        num_requests = 5
+
+    client.adapter.poolmanager.pools["key"] = FakePool()
+    assert client.stats() == {
+        "requests": 0,
+        "connections_opened": 1,
+        "connections_reused": 4,
+        "cache_hits": 0,
+        "throttled": 0,
+        "retried": 0,
+        "failed": 0,
+    }
+
+
+def test_cli_reports_connection_reuse(tmp_path):
+    data = {
+        "/api/v9/workspaces": [{"id": 1, "at": "2024-01-01T00:00:00+00:00"}, {"id": 2, "at": "2024-01-01T00:00:00+00:00"}],
+        "/api/v9/workspaces/1/projects": [{"id": 10}],
+        "/api/v9/workspaces/2/projects": [{"id": 20}],
+    }
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = json.dumps(data[urllib.parse.urlparse(self.path).path]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    try:
+        result = CliRunner().invoke(
+            cli,
+            ["fetch", str(tmp_path / "toggl.db"), "--auth", str(auth_file), "-t", "workspaces", "-t", "projects"]
+            + ["--rate-limit", "0", "--api-url", f"http://127.0.0.1:{server.server_address[1]}/api/v9"],
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert result.exit_code == 0, result.output
+    assert "🔌 3 API requests, 1 connections opened, 2 reused" in result.output
+
+
+def test_token_bucket_waits_when_empty(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("toggl_to_sqlite.client.time.sleep", sleeps.append)
+    bucket = TokenBucket(rate=2.0, capacity=1.0)
+
+    assert bucket.acquire() == 0.0
+    waited = bucket.acquire()
+
+    assert 0 < waited <= 0.5
+    assert sleeps == [waited]
+
+
+def test_client_rate_limits_requests(requests_mock, monkeypatch):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[])
+    acquired = []
+    client = TogglClient("token", rate_limit=5)
+    monkeypatch.setattr(client.rate_limiter, "acquire", lambda: acquired.append(1))
+
+    client.get("workspaces")
+    client.get("workspaces")
+
+    assert len(acquired) == 2
+    assert TogglClient("token").rate_limiter is None
+
+
+def test_workspaces_fetched_once_per_run(requests_mock):
+    workspaces = requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/workspaces/1/projects", json=[{"id": 10}])
+    client = TogglClient("token")
+
+    get_start_datetime("token", client=client)
+    list(get_workspaces("token", client=client))
+    list(get_projects("token", client=client))
+
+    assert workspaces.call_count == 1
+    assert client.stats()["cache_hits"] == 2
+
+
+def test_errors_are_not_cached(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", status_code=500)
+    client = TogglClient("token", max_retries=0)
+
+    client.get("workspaces", cache=True)
+    client.get("workspaces", cache=True)
+
+    assert requests_mock.call_count == 2
+
+
+def test_cache_key_includes_params():
+    assert ResponseCache.key("u", {"a": 1}) == ResponseCache.key("u", (("a", "1"),))
+    assert ResponseCache.key("u", {"a": 1}) != ResponseCache.key("u", {"a": 2})
+
+
+def test_cache_file_is_scoped_to_the_api_token(tmp_path, requests_mock):
+    alice = "Basic " + base64.b64encode(b"alice:api_token").decode()
+    requests_mock.get(
+        f"{API_BASE_URL}/workspaces",
+        json=lambda request, context: [{"id": 1 if request.headers["Authorization"] == alice else 2}],
+    )
+    path = str(tmp_path / "cache.json")
+
+    with TogglClient("alice", cache=ResponseCache(path, ttl=60)) as client:
+        assert client.get("workspaces", cache=True).json() == [{"id": 1}]
+    with TogglClient("bob", cache=ResponseCache(path, ttl=60)) as client:
+        assert client.get("workspaces", cache=True).json() == [{"id": 2}]
+    with TogglClient("alice", cache=ResponseCache(path, ttl=60)) as client:
+        assert client.get("workspaces", cache=True).json() == [{"id": 1}]
+
+    assert requests_mock.call_count == 2
+    assert "alice" not in open(path).read()
+
+
+def test_cache_persisted_to_disk_with_ttl(tmp_path, requests_mock, monkeypatch):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1}])
+    path = str(tmp_path / "cache.json")
+
+    with TogglClient("token", cache=ResponseCache(path, ttl=60)) as client:
+        client.get("workspaces", cache=True)
+
+    with TogglClient("token", cache=ResponseCache(path, ttl=60)) as client:
+        assert client.get("workspaces", cache=True).json() == [{"id": 1}]
+    assert requests_mock.call_count == 1
+
+    # Once the TTL has passed the entry is dropped when the cache is loaded
+    now = time.time()
+    monkeypatch.setattr("toggl_to_sqlite.client.time.time", lambda: now + 61)
+    assert ResponseCache(path, ttl=60).entries == {}
+
+
+def test_retries_throttled_requests_honouring_retry_after(requests_mock, monkeypatch):
+    waits = []
+    requests_mock.get(
+        f"{API_BASE_URL}/workspaces",
+        [
+            {"status_code": 429, "headers": {"Retry-After": "7"}},
+            {"status_code": 503},
+            {"json": [{"id": 1}]},
+        ],
+    )
+    client = TogglClient("token")
+    monkeypatch.setattr(client, "_wait", waits.append)
+
+    response = client.get("workspaces")
+
+    assert response.json() == [{"id": 1}]
+    assert waits[0] >= 7
+    assert 0 <= waits[1] <= 2
+    stats = client.stats()
+    assert (stats["requests"], stats["throttled"], stats["retried"], stats["failed"]) == (3, 1, 2, 0)
+
+
+def test_gives_up_after_max_retries(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", status_code=500)
+    client = TogglClient("token", max_retries=2)
+
+    assert client.get("workspaces").status_code == 500
+    assert requests_mock.call_count == 3
+    assert client.stats()["failed"] == 1
+
+
+def test_connection_errors_retried_then_raised(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", exc=requests.ConnectionError)
+    client = TogglClient("token", max_retries=1)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get("workspaces")
+    assert client.stats()["retried"] == 1
+    assert client.stats()["failed"] == 1
+
+
+def test_failed_time_entry_window_raises(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", status_code=429)
+
+    with pytest.raises(TogglAPIError):
+        get_time_entries_window(TogglClient("token", max_retries=0), ("2023-01-01", "2023-01-02"))
+
+
+def test_cli_failed_window_is_reported_without_traceback(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", status_code=500, json={})
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+
+    result = CliRunner().invoke(
+        cli,
+        ["fetch", str(tmp_path / "toggl.db"), "--auth", str(auth_file), "-t", "time_entries"]
+        + ["--rate-limit", "0", "--max-retries", "0", "--since", "2023-01-01", "--days", "400"],
+    )
+
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert "Error: Toggl answered 500 fetching time entries 2023-01-01" in result.output
+    assert "running fetch again resumes" in result.output
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_token_bucket_pause_holds_back_callers(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("toggl_to_sqlite.client.time.sleep", sleeps.append)
+    bucket = TokenBucket(rate=1.0, capacity=1.0)
+
+    bucket.pause(5)
+    bucket.acquire()
+
+    assert 5 < sleeps[0] <= 6
+
+
+def test_token_bucket_shared_per_token():
+    assert get_token_bucket("shared", 1.0) is get_token_bucket("shared", 2.0)
+    assert get_token_bucket("shared", 1.0) is not get_token_bucket("other", 1.0)
+
+
+def test_cli_reports_retry_counters(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", [{"status_code": 429}, {"json": [{"id": 1}]}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text('{"api_token": "cli-token"}')
+
+    result = CliRunner().invoke(
+        cli, ["fetch", str(tmp_path / "t.db"), "--auth", str(auth_file), "-t", "workspaces", "--burst", "2", "--max-retries", "1"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "⏳ 1 throttled, 1 retried, 0 failed" in result.output
+
+
+def test_cache_file_never_contains_api_tokens(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "api_token": "SECRET"}])
+    path = tmp_path / "cache.json"
+
+    with TogglClient("token", cache=ResponseCache(str(path), ttl=60)) as client:
+        client.get("workspaces", cache=True)
+
+    assert "SECRET" not in path.read_text()
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_fallback_client_is_closed(requests_mock, monkeypatch):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    closed = []
+    monkeypatch.setattr(TogglClient, "close", lambda self: closed.append(self))
+
+    get_start_datetime("token")
+    list(get_workspaces("token"))
+    assert len(closed) == 2
+
+    shared = TogglClient("token")
+    list(get_workspaces("token", client=shared))
+    assert shared not in closed
+
+
+def test_cli_api_url_option(tmp_path, requests_mock):
+    requests_mock.get("http://127.0.0.1:8000/api/v9/workspaces", json=[{"id": 1}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text('{"api_token": "cli-token"}')
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "fetch",
+            str(tmp_path / "t.db"),
+            "--auth",
+            str(auth_file),
+            "-t",
+            "workspaces",
+            "--api-url",
+            "http://127.0.0.1:8000/api/v9",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "💾 Saved 1 workspaces" in result.output
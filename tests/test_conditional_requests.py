@@ -0,0 +1,101 @@
+"""Tests for conditional requests of reference data."""
+
+import datetime
+
+import sqlite_utils
+
+from toggl_to_sqlite.client import TogglClient
+from toggl_to_sqlite.utils import HTTP_CACHE_TABLE, get_projects, get_start_datetime, get_workspaces, save_items
+
+API = "https://api.track.toggl.com/api/v9"
+
+
+def sync_workspaces(db):
+    return save_items(get_workspaces("token", client=TogglClient("token"), db=db), "workspaces", db)
+
+
+def test_etag_sent_and_304_skips_save(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1, "api_token": "secret"}], headers={"ETag": '"v1"'})
+    assert sync_workspaces(db)["rows"] == 1
+
+    row = db[HTTP_CACHE_TABLE].get((f'["{API}/workspaces", []]', "workspaces"))
+    assert row["etag"] == '"v1"'
+    assert "secret" not in row["body"]
+
+    requests_mock.get(f"{API}/workspaces", status_code=304)
+    assert sync_workspaces(db)["rows"] == 0
+    assert requests_mock.last_request.headers["If-None-Match"] == '"v1"'
+
+
+def test_unchanged_content_hash_skips_save(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1}], headers={"Last-Modified": "Wed, 01 Mar 2023 00:00:00 GMT"})
+    assert sync_workspaces(db)["rows"] == 1
+    assert sync_workspaces(db)["rows"] == 0
+    assert requests_mock.last_request.headers["If-Modified-Since"] == "Wed, 01 Mar 2023 00:00:00 GMT"
+
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1, "name": "Renamed"}])
+    assert sync_workspaces(db)["rows"] == 1
+    assert db["workspaces"].get(1)["name"] == "Renamed"
+
+
+def test_errors_are_not_recorded(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", status_code=500)
+
+    assert sync_workspaces(db)["rows"] == 0
+    assert HTTP_CACHE_TABLE not in db.table_names()
+
+
+def test_projects_only_saved_for_changed_workspaces(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1}, {"id": 2}], headers={"ETag": '"w"'})
+    requests_mock.get(f"{API}/workspaces/1/projects", json=[{"id": 10}])
+    requests_mock.get(f"{API}/workspaces/2/projects", json=[{"id": 20}])
+
+    def sync_projects():
+        return save_items(get_projects("token", client=TogglClient("token"), db=db), "projects", db)["rows"]
+
+    assert sync_projects() == 2
+
+    # The workspace list is answered from the stored body on a 304
+    requests_mock.get(f"{API}/workspaces", status_code=304)
+    requests_mock.get(f"{API}/workspaces/2/projects", json=[{"id": 20}, {"id": 21}])
+    assert sync_projects() == 2
+    assert [row["id"] for row in db["projects"].rows] == [10, 20, 21]
+
+
+def test_dropped_table_is_saved_again(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1}], headers={"ETag": '"v1"'})
+    assert sync_workspaces(db)["rows"] == 1
+
+    db["workspaces"].drop()
+    assert sync_workspaces(db)["rows"] == 1
+    assert "If-None-Match" not in requests_mock.last_request.headers
+
+
+def test_force_full_ignores_validators(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1}], headers={"ETag": '"v1"'})
+    assert sync_workspaces(db)["rows"] == 1
+
+    workspaces = get_workspaces("token", client=TogglClient("token"), db=db, force_full=True)
+    assert save_items(workspaces, "workspaces", db)["rows"] == 1
+    assert "If-None-Match" not in requests_mock.last_request.headers
+
+
+def test_start_datetime_revalidates_workspaces(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}], headers={"ETag": '"v1"'})
+    assert sync_workspaces(db)["rows"] == 1
+
+    requests_mock.get(f"{API}/workspaces", status_code=304)
+    client = TogglClient("token")
+    assert get_start_datetime("token", client=client, db=db) == datetime.date(2023, 1, 1)
+    assert requests_mock.last_request.headers["If-None-Match"] == '"v1"'
+
+    # The workspaces sync reuses the revalidated response instead of fetching again
+    assert save_items(get_workspaces("token", client=client, db=db), "workspaces", db)["rows"] == 0
+    assert requests_mock.call_count == 2
@@ -0,0 +1,124 @@
+"""Tests for SQLite database helpers."""
+
+import json
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import database
+from toggl_to_sqlite.cli import cli
+
+
+@pytest.fixture
+def db(tmp_path):
+    return sqlite_utils.Database(tmp_path / "toggl.db")
+
+
+def test_pragmas_applied_then_restored(db):
+    with database.pragmas(db, database.FAST_PRAGMAS) as previous:
+        assert database.get_pragma(db, "journal_mode") == "wal"
+        assert database.get_pragma(db, "synchronous") == 1
+        assert database.get_pragma(db, "temp_store") == 2
+        db["t"].insert({"id": 1})
+
+    assert previous["journal_mode"] == "delete"
+    assert database.get_pragma(db, "journal_mode") == "delete"
+    assert database.get_pragma(db, "synchronous") == previous["synchronous"]
+    assert db["t"].count == 1
+
+
+def test_invalid_pragma_rejected(db):
+    with pytest.raises(ValueError):
+        database.set_pragmas(db, {"journal_mode; drop table t": "wal"})
+
+
+def test_cli_fast_and_pragma_options(tmp_path, requests_mock):
+    requests_mock.get("https://api.track.toggl.com/api/v9/workspaces", json=[{"id": 1}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+
+    result = CliRunner().invoke(
+        cli, ["fetch", db_file, "--auth", str(auth_file), "-t", "workspaces", "--fast", "--pragma", "cache_size=-2000"]
+    )
+
+    assert result.exit_code == 0, result.output
+    db = sqlite_utils.Database(db_file)
+    assert database.get_pragma(db, "journal_mode") == "delete"
+    assert db["workspaces"].count == 1
+
+
+def test_cli_rejects_malformed_pragma(tmp_path):
+    result = CliRunner().invoke(cli, ["fetch", str(tmp_path / "toggl.db"), "--pragma", "cache_size"])
+
+    assert result.exit_code == 2
+    assert "should look like NAME=VALUE" in result.output
+
+
+def index_names(db, table):
+    return {index.name for index in db[table].indexes}
+
+
+def test_ensure_indexes_skips_missing_columns(db):
+    db["time_entries"].insert({"id": 1, "start": "2023-01-01T00:00:00+00:00", "project_id": 2}, pk="id")
+
+    assert database.ensure_indexes(db) == ["idx_time_entries_start", "idx_time_entries_project_id"]
+    assert database.ensure_indexes(db) == []
+
+    db["time_entries"].insert({"id": 2, "workspace_id": 3, "user_id": 4}, alter=True)
+    assert database.ensure_indexes(db, ["time_entries"]) == ["idx_time_entries_workspace_id", "idx_time_entries_user_id"]
+    assert database.ensure_indexes(db, ["workspaces", "projects"]) == []
+
+
+def test_deferred_indexes_dropped_during_backfill(db):
+    db["time_entries"].insert({"id": 1, "start": "2023-01-01", "project_id": 2, "workspace_id": 3, "user_id": 4}, pk="id")
+    database.ensure_indexes(db)
+
+    with database.deferred_indexes(db, ["time_entries"], defer=True) as built:
+        assert index_names(db, "time_entries") == set()
+        db["time_entries"].insert({"id": 2, "start": "2023-01-02"})
+    assert len(built) == 4
+    assert index_names(db, "time_entries") == {database.index_name("time_entries", c) for c in database.INDEXES["time_entries"]}
+
+    with database.deferred_indexes(db, ["time_entries"]) as built:
+        assert len(index_names(db, "time_entries")) == 4
+    assert built == []
+
+
+def test_cli_builds_indexes_after_first_sync(tmp_path, requests_mock):
+    requests_mock.get("https://api.track.toggl.com/api/v9/workspaces", json=[{"id": 3, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(
+        "https://api.track.toggl.com/api/v9/me/time_entries",
+        json=[{"id": 1, "start": "2023-01-01T00:00:00+00:00", "project_id": 2, "workspace_id": 3, "user_id": 4}],
+    )
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+    args = ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "--since", "2023-01-01", "--rate-limit", "0"]
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "🗂️  Built 4 indexes" in result.output
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "Built" not in result.output
+    assert len(index_names(sqlite_utils.Database(db_file), "time_entries")) == 4
+
+
+def test_cli_ensure_indexes(db, tmp_path):
+    db["time_entries"].insert({"id": 1, "start": "2023-01-01", "project_id": 2}, pk="id")
+    db["projects"].insert({"id": 2, "workspace_id": 3}, pk="id")
+    db_file = str(tmp_path / "toggl.db")
+
+    result = CliRunner().invoke(cli, ["ensure-indexes", db_file])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == [
+        "🗂️  Built idx_time_entries_start",
+        "🗂️  Built idx_time_entries_project_id",
+        "🗂️  Built idx_projects_workspace_id",
+    ]
+
+    assert CliRunner().invoke(cli, ["ensure-indexes", db_file]).output == "🗂️  All indexes already exist\n"
+    assert "🗂️  Built idx_projects_workspace_id" in CliRunner().invoke(cli, ["ensure-indexes", db_file, "--rebuild"]).output
@@ -0,0 +1,89 @@
+"""Tests for delta syncs through the ``since`` parameter."""
+
+import datetime
+import json
+
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import utils
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL, TogglClient
+
+NOW = datetime.datetime(2024, 6, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def entry(id, start, **extra):
+    return {
+        "id": id,
+        "start": start,
+        "at": "2024-06-01T11:00:00+00:00",
+        "duration": 60,
+        "workspace_id": 1,
+        "project_id": 2,
+        **extra,
+    }
+
+
+def test_delta_since_needs_a_recent_sync():
+    db = sqlite_utils.Database(":memory:")
+    assert utils.get_delta_since(db, now=NOW) is None
+
+    utils.update_sync_time(db, "time_entries", NOW - datetime.timedelta(days=100))
+    assert utils.get_delta_since(db, now=NOW) is None
+
+    utils.update_sync_time(db, "time_entries", NOW - datetime.timedelta(hours=1))
+    assert utils.get_delta_since(db, now=NOW) == NOW - datetime.timedelta(hours=1) - utils.DELTA_OVERLAP
+
+
+def test_delta_upserts_and_deletes(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    utils.save_items([[entry(1, "2024-05-01T09:00:00+00:00"), entry(2, "2024-05-02T09:00:00+00:00")]], "time_entries", db)
+    requests_mock.get(
+        f"{API_BASE_URL}/me/time_entries",
+        json=[
+            # Moved from May 1st to May 3rd
+            entry(1, "2024-05-03T09:00:00+00:00", at="2024-06-01T11:30:00+00:00"),
+            entry(2, "2024-05-02T09:00:00+00:00", server_deleted_at="2024-06-01T11:45:00+00:00"),
+            entry(3, "2024-05-31T09:00:00+00:00"),
+        ],
+    )
+
+    stats = utils.save_time_entries_delta("token", db, NOW - datetime.timedelta(hours=1), client=TogglClient("token"))
+
+    assert requests_mock.last_request.qs == {"since": [str(int(NOW.timestamp()) - 3600)]}
+    assert (stats["written"], stats["deleted"]) == (2, 1)
+    assert [day.isoformat() for day in stats["days"]] == ["2024-05-01", "2024-05-02", "2024-05-03", "2024-05-31"]
+    assert sorted(row["id"] for row in db["time_entries"].rows) == [1, 3]
+    assert db["time_entries"].get(1)["start"] == "2024-05-03T09:00:00+00:00"
+
+
+def test_cli_delta_after_a_windowed_sync(tmp_path, requests_mock):
+    today = datetime.date.today()
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    time_entries = requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=[entry(1, f"{today}T09:00:00+00:00")])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+    args = ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "--rate-limit", "0", "--days", "3", "--delta"]
+
+    # No previous sync, so the first run sweeps date windows
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "changed since" not in result.output
+    assert all("start_date" in request.qs for request in time_entries.request_history)
+
+    first_run = len(requests_mock.request_history)
+    requests_mock.get(
+        f"{API_BASE_URL}/me/time_entries",
+        json=[entry(1, f"{today}T09:00:00+00:00", server_deleted_at=f"{today}T10:00:00+00:00")],
+    )
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "📅 Fetching time entries changed since" in result.output
+    assert "🗑️  Deleted 1 time_entries" in result.output
+    requests = [request for request in requests_mock.request_history[first_run:] if "time_entries" in request.path]
+    assert [list(request.qs) for request in requests] == [["since"]]
+    db = sqlite_utils.Database(db_file)
+    assert db["time_entries"].count == 0
+    assert db["daily_project_totals"].count == 0
@@ -0,0 +1,163 @@
+"""Tests for the asyncio fetch engine."""
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+
+import pytest
+import requests
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import database, engine, utils
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import TogglClient
+
+API = "https://api.track.toggl.com/api/v9"
+
+
+def mock_api(requests_mock):
+    requests_mock.get(f"{API}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00", "api_token": "x"}, {"id": 2}])
+    requests_mock.get(f"{API}/workspaces/1/projects", json=[{"id": 10, "name": "One"}])
+    requests_mock.get(f"{API}/workspaces/2/projects", json=[])
+
+    def time_entries(request, context):
+        return [{"id": request.qs["start_date"][0], "description": "Entry"}]
+
+    requests_mock.get(f"{API}/me/time_entries", json=time_entries)
+
+
+def test_fetch_saves_all_types(requests_mock):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+    since = datetime.datetime.now() - datetime.timedelta(days=30)
+
+    saved = engine.fetch("token", db, days=10, since=since, concurrency=3)
+
+    assert {table: stats["rows"] for table, stats in saved.items()} == {"time_entries": 3, "workspaces": 2, "projects": 1}
+    assert [row["id"] for row in db["projects"].rows] == [10]
+    assert "api_token" not in db["workspaces"].columns_dict
+    # Windows are written in chronological order
+    ids = [row["id"] for row in db.query("select id from time_entries order by rowid")]
+    assert ids == sorted(ids)
+
+
+def test_fetch_only_requested_types(requests_mock):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+
+    saved = engine.fetch("token", db, types=("projects",))
+
+    assert list(saved) == ["projects"]
+    assert "time_entries" not in db.table_names() and "workspaces" not in db.table_names()
+
+
+def test_cli_async_engine(requests_mock):
+    mock_api(requests_mock)
+    runner = CliRunner()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        auth_file = os.path.join(temp_dir, "auth.json")
+        with open(auth_file, "w") as f:
+            json.dump({"api_token": "test_token"}, f)
+        db_file = os.path.join(temp_dir, "test.db")
+
+        since = (datetime.date.today() - datetime.timedelta(days=5)).isoformat()
+        result = runner.invoke(
+            cli, ["fetch", db_file, "--auth", auth_file, "--engine", "async", "--since", since, "--rate-limit", "0"]
+        )
+
+        assert result.exit_code == 0, result.output
+        assert "💾 Saved 1 projects" in result.output
+        db = sqlite_utils.Database(db_file)
+        assert {"time_entries_since", "workspaces_since", "projects_since"} <= set(db.table_names())
+
+
+def test_writer_failure_cancels_fetchers(requests_mock, monkeypatch):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+
+    def fail(*args, **kwargs):
+        raise ValueError("disk full")
+
+    monkeypatch.setattr("toggl_to_sqlite.utils.save_items", fail)
+    since = datetime.datetime.now() - datetime.timedelta(days=100)
+
+    with pytest.raises(ValueError, match="disk full"):
+        engine.fetch("token", db, days=1, since=since, concurrency=2)
+
+
+def test_fetch_failure_rolls_back(requests_mock):
+    mock_api(requests_mock)
+    requests_mock.get(f"{API}/me/time_entries", [{"json": [{"id": 1}]}, {"exc": requests.ConnectionError}])
+    db = database.connect(":memory:")
+    since = datetime.datetime.now() - datetime.timedelta(days=3)
+
+    with pytest.raises(requests.ConnectionError):
+        engine.fetch(
+            "token", db, types=("time_entries",), days=1, since=since, client=TogglClient("token", max_retries=0), concurrency=1
+        )
+    assert not db["time_entries"].exists() or db["time_entries"].count == 0
+
+
+def test_windows_ahead_of_writer_are_bounded(requests_mock, monkeypatch):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+    lock = threading.Lock()
+    fetched, saved, ahead = [0], [0], []
+    fetch_window, save_items = engine.utils.get_time_entries_window, engine.utils.save_items
+
+    def counting_fetch(client, window):
+        with lock:
+            fetched[0] += 1
+            ahead.append(fetched[0] - saved[0])
+        return fetch_window(client, window)
+
+    def counting_save(*args, **kwargs):
+        with lock:
+            saved[0] += 1
+        return save_items(*args, **kwargs)
+
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_time_entries_window", counting_fetch)
+    monkeypatch.setattr("toggl_to_sqlite.utils.save_items", counting_save)
+    since = datetime.datetime.now() - datetime.timedelta(days=60)
+
+    result = engine.fetch("token", db, types=("time_entries",), days=1, since=since, concurrency=2)
+
+    assert result["time_entries"]["rows"] == 60
+    # In flight, plus the queue (twice the concurrency), plus the page being written
+    assert max(ahead) <= 2 + 4 + 1
+
+
+def test_cli_async_engine_rejects_adaptive(tmp_path):
+    result = CliRunner().invoke(cli, ["fetch", str(tmp_path / "t.db"), "--engine", "async", "--adaptive"])
+
+    assert result.exit_code == 2
+    assert "--adaptive is only supported by --engine threads" in result.output
+
+
+def test_fetch_skips_unchanged_reference_data(requests_mock):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+
+    def sync(**kwargs):
+        saved = engine.fetch("token", db, types=("workspaces", "projects"), **kwargs)
+        return {table: stats["rows"] for table, stats in saved.items()}
+
+    assert sync() == {"workspaces": 2, "projects": 1}
+    assert sync() == {}
+    assert sync(force_full=True) == {"workspaces": 2, "projects": 1}
+
+
+def test_fetch_resumes_after_checkpointed_windows(requests_mock):
+    mock_api(requests_mock)
+    db = database.connect(":memory:")
+    start = datetime.date.today() - datetime.timedelta(days=3)
+    utils.record_checkpoint(db, start, start + datetime.timedelta(days=2), [])
+
+    saved = engine.fetch("token", db, types=("time_entries",), days=1, since=datetime.datetime.combine(start, datetime.time()))
+
+    assert saved["time_entries"]["rows"] == 1
+    assert utils.get_resume_date(db, start) == start + datetime.timedelta(days=3)
@@ -0,0 +1,96 @@
+"""Tests for the full-text search index."""
+
+import json
+
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import fts
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL
+from toggl_to_sqlite.utils import save_items
+
+
+def search(db, query):
+    return [
+        row[0] for row in db.execute(f"select rowid from {fts.FTS_TABLE} where {fts.FTS_TABLE} match ? order by rowid", [query])
+    ]
+
+
+def test_enable_indexes_existing_entries_with_project_names():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[{"id": 10, "name": "Apollo"}]], "projects", db)
+    save_items(
+        [[{"id": 1, "description": "Design review", "project_id": 10}, {"id": 2, "description": None}]], "time_entries", db
+    )
+
+    assert fts.enable(db) == 2
+
+    assert search(db, "review") == [1]
+    assert search(db, "apollo") == [1]
+    assert search(db, "project:apollo") == [1]
+
+
+def test_triggers_keep_index_in_sync():
+    db = sqlite_utils.Database(":memory:")
+    fts.enable(db)
+
+    save_items([[{"id": 10, "name": "Apollo"}]], "projects", db)
+    save_items([[{"id": 1, "description": "Design review", "project_id": 10}]], "time_entries", db)
+    assert search(db, "apollo") == [1]
+
+    # Updated entries and renamed projects are reindexed, deleted entries removed
+    save_items(
+        [[{"id": 1, "description": "Rocket launch", "project_id": 10}, {"id": 2, "description": "Launch party"}]],
+        "time_entries",
+        db,
+    )
+    save_items([[{"id": 10, "name": "Artemis"}]], "projects", db)
+    assert search(db, "review") == []
+    assert search(db, "launch") == [1, 2]
+    assert search(db, "apollo") == [] and search(db, "artemis") == [1]
+
+    db["time_entries"].delete(2)
+    assert search(db, "launch") == [1]
+    assert db[fts.FTS_TABLE].count == 1
+
+
+def test_client_names_from_clients_table():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[{"id": 10, "name": "Apollo", "client_id": 5}]], "projects", db)
+    save_items([[{"id": 1, "description": "Design review", "project_id": 10}]], "time_entries", db)
+    fts.enable(db)
+    assert fts.ensure(db) is None
+
+    save_items([[{"id": 5, "name": "NASA"}]], "clients", db)
+    # The new table makes the triggers out of date, so the index is rebuilt
+    assert fts.ensure(db) == 1
+    assert search(db, "client:nasa") == [1]
+
+    save_items([[{"id": 5, "name": "ESA"}]], "clients", db)
+    assert search(db, "client:esa") == [1]
+
+
+def test_cli_fts_option_and_command(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=[{"id": 1, "description": "Design review", "project_id": None}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+    args = ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "--rate-limit", "0", "--fts"]
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "🔎 Indexed 1 time entries for full-text search" in result.output
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert "🔎" not in result.output
+
+    result = CliRunner().invoke(cli, ["enable-fts", db_file, "--disable"])
+    assert result.exit_code == 0, result.output
+    assert not fts.is_enabled(sqlite_utils.Database(db_file))
+
+    result = CliRunner().invoke(cli, ["enable-fts", db_file])
+    assert result.output == "🔎 Indexed 1 time entries for full-text search\n"
+    assert search(sqlite_utils.Database(db_file), "design") == [1]
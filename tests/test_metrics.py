@@ -0,0 +1,108 @@
+"""Tests for per-phase fetch metrics."""
+
+import json
+
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL, TogglClient
+from toggl_to_sqlite.metrics import Metrics, percentile
+from toggl_to_sqlite.writer import BulkWriter
+
+
+def test_summary_and_histogram_buckets():
+    metrics = Metrics()
+    for seconds in (0.002, 0.02, 0.2, 2.0):
+        metrics.observe("insert", seconds)
+    metrics.observe("since", 0.5)
+
+    summary = metrics.summary()
+
+    assert list(summary["phases"]) == ["since", "insert"]
+    insert = summary["phases"]["insert"]
+    assert insert["count"] == 4
+    assert insert["max"] == 2.0
+    assert insert["buckets"]["0.005"] == 1
+    assert insert["buckets"]["0.25"] == 3
+    assert insert["buckets"]["10.0"] == 4
+
+
+def test_percentile():
+    assert percentile([], 0.95) == 0.0
+    assert percentile([1, 2, 3, 4], 0.5) == 2
+    assert percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_client_records_requests_and_decoding(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", [{"status_code": 429}, {"json": [{"id": 1}]}])
+    metrics = Metrics()
+    client = TogglClient("token", metrics=metrics)
+
+    assert client.decode(client.get("workspaces")) == [{"id": 1}]
+
+    summary = metrics.summary()
+    assert summary["http"]["statuses"] == {"200": 1, "429": 1}
+    assert summary["http"]["bytes"] == len(b'[{"id": 1}]')
+    assert summary["phases"]["http_request"]["count"] == 2
+    assert summary["phases"]["json_decode"]["count"] == 1
+
+
+def test_writer_records_each_insert():
+    metrics = Metrics()
+    writer = BulkWriter(sqlite_utils.Database(":memory:"), "t", batch_size=2, metrics=metrics)
+
+    writer.write([{"id": n} for n in range(5)])
+
+    assert metrics.summary()["phases"]["insert"]["count"] == 3
+
+
+def test_prometheus_textfile():
+    metrics = Metrics()
+    metrics.observe_response(200, 0.03, 100)
+
+    text = metrics.prometheus()
+
+    assert "# TYPE toggl_to_sqlite_phase_seconds histogram" in text
+    assert 'toggl_to_sqlite_phase_seconds_bucket{phase="http_request",le="0.025"} 0' in text
+    assert 'toggl_to_sqlite_phase_seconds_bucket{phase="http_request",le="0.05"} 1' in text
+    assert 'toggl_to_sqlite_phase_seconds_count{phase="http_request"} 1' in text
+    assert 'toggl_to_sqlite_http_responses_total{status="200"} 1' in text
+    assert "toggl_to_sqlite_http_response_bytes_total 100" in text
+
+
+def test_cli_metrics_table_and_files(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=[{"id": 10}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text('{"api_token": "token"}')
+    args = [
+        "fetch",
+        str(tmp_path / "t.db"),
+        "--auth",
+        str(auth_file),
+        "-t",
+        "time_entries",
+        "-t",
+        "workspaces",
+        "--rate-limit",
+        "0",
+    ]
+
+    result = CliRunner().invoke(cli, [*args, "--metrics", "--metrics-file", str(tmp_path / "metrics.json")])
+
+    assert result.exit_code == 0, result.output
+    for phase in ("since", "http_request", "json_decode", "insert"):
+        assert f"⏱️  {phase}" in result.output
+    assert "HTTP requests" in result.output
+    assert set(json.loads((tmp_path / "metrics.json").read_text())["phases"]) == {
+        "since",
+        "http_request",
+        "json_decode",
+        "insert",
+    }
+
+    result = CliRunner().invoke(cli, [*args, "--metrics-file", str(tmp_path / "toggl.prom")])
+    assert result.exit_code == 0, result.output
+    assert "⏱️" not in result.output
+    assert "toggl_to_sqlite_phase_seconds_sum" in (tmp_path / "toggl.prom").read_text()
@@ -0,0 +1,89 @@
+"""Tests for fetch --profile and profile-report."""
+
+import datetime
+import pstats
+
+import pytest
+from click.testing import CliRunner
+
+from toggl_to_sqlite import profiling
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL
+
+
+@pytest.fixture
+def fetch_args(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=[{"id": 10}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text('{"api_token": "token"}')
+    return ["fetch", str(tmp_path / "t.db"), "--auth", str(auth_file), "-t", "time_entries", "--rate-limit", "0"]
+
+
+def test_profile_option_writes_stats(tmp_path, fetch_args):
+    profile_path = tmp_path / "fetch.prof"
+
+    result = CliRunner().invoke(cli, [*fetch_args, "--profile", str(profile_path)])
+
+    assert result.exit_code == 0, result.output
+    assert f"🔬 Profiling this run to {profile_path}" in result.output
+    functions = {function for _, _, function in pstats.Stats(str(profile_path)).stats}
+    assert "save_items" in functions
+
+
+def test_profile_env_var(tmp_path, fetch_args):
+    profile_path = tmp_path / "scheduled.prof"
+
+    result = CliRunner().invoke(cli, fetch_args, env={profiling.PROFILE_ENV: str(profile_path)})
+
+    assert result.exit_code == 0, result.output
+    assert profile_path.exists()
+
+
+def test_profile_written_when_fetch_fails(tmp_path, fetch_args, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", status_code=403)
+    profile_path = tmp_path / "failed.prof"
+
+    result = CliRunner().invoke(cli, [*fetch_args, "--max-retries", "0", "--profile", str(profile_path)])
+
+    assert result.exit_code != 0
+    assert profile_path.exists()
+
+
+def test_profile_report(tmp_path, fetch_args):
+    profile_path = tmp_path / "fetch.prof"
+    CliRunner().invoke(cli, [*fetch_args, "--profile", str(profile_path)])
+
+    rows = profiling.hottest(str(profile_path), limit=5, sort="tottime")
+    assert 0 < len(rows) <= 5
+    assert [row["own_seconds"] for row in rows] == sorted((row["own_seconds"] for row in rows), reverse=True)
+
+    result = CliRunner().invoke(cli, ["profile-report", str(profile_path), "--limit", "50"])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0].split() == ["calls", "own", "s", "cumul", "s", "function"]
+    assert any("save_items" in line for line in lines)
+    assert not any("decoder.py" in line for line in lines[1:])
+
+    result = CliRunner().invoke(cli, ["profile-report", str(profile_path), "--all", "--limit", "1000"])
+    assert any("decoder.py" in line for line in result.output.splitlines())
+
+
+def test_in_packages():
+    assert profiling.in_packages("/venv/lib/site-packages/sqlite_utils/db.py", profiling.REPORT_PACKAGES)
+    assert profiling.in_packages("/src/toggl_to_sqlite/utils.py", profiling.REPORT_PACKAGES)
+    assert not profiling.in_packages("/usr/lib/python3.11/json/decoder.py", profiling.REPORT_PACKAGES)
+
+
+def test_profile_includes_worker_threads(tmp_path, fetch_args):
+    profile_path = tmp_path / "threads.prof"
+
+    since = (datetime.date.today() - datetime.timedelta(days=20)).isoformat()
+    args = ["--since", since, "--days", "5", "--concurrency", "3", "--profile", str(profile_path)]
+
+    result = CliRunner().invoke(cli, [*fetch_args, *args])
+
+    assert result.exit_code == 0, result.output
+    # Windows are fetched on pool threads when --concurrency is above 1
+    functions = {function for _, _, function in pstats.Stats(str(profile_path)).stats}
+    assert {"get_time_entries_window", "save_items"} <= functions
@@ -0,0 +1,119 @@
+"""Tests for reconciling saved time entries with Toggl."""
+
+import datetime
+import json
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import tags, utils
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL, TogglClient
+from toggl_to_sqlite.utils import reconcile_time_entries, save_items
+
+SINCE = datetime.datetime(2023, 1, 1)
+
+
+def entry(id, day, at="2023-02-01T00:00:00+00:00", **extra):
+    return {
+        "id": id,
+        "start": f"2023-01-{day:02d}T09:00:00+00:00",
+        "at": at,
+        "duration": 60,
+        "workspace_id": 1,
+        "project_id": 7,
+        **extra,
+    }
+
+
+@pytest.fixture
+def remote(requests_mock):
+    entries = []
+
+    def time_entries(request, context):
+        start, end = (datetime.date.fromisoformat(request.qs[name][0][:10]) for name in ("start_date", "end_date"))
+        found = [e for e in entries if start <= datetime.date.fromisoformat(e["start"][:10]) < end]
+        return found[: utils.TIME_ENTRIES_RESULT_CAP]
+
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=time_entries)
+    return entries
+
+
+def test_only_differing_windows_are_written(remote):
+    db = sqlite_utils.Database(":memory:")
+    saved = [entry(1, 2), entry(2, 3), entry(3, 15, tags=["dev"]), entry(4, 25)]
+    save_items([saved], "time_entries", db, normalize_tags=True)
+    # Entry 2 was edited, 3 deleted and 5 added in Toggl; the window holding 4 is unchanged
+    remote.extend([entry(1, 2), entry(2, 3, at="2023-03-01T00:00:00+00:00", description="Edited"), entry(4, 25), entry(5, 16)])
+
+    stats = reconcile_time_entries("token", db, days=10, since=SINCE, client=TogglClient("token", rate_limiter=None))
+
+    assert stats["windows"] > 3
+    assert {key: stats[key] for key in ("windows_changed", "rows", "deleted")} == {"windows_changed": 2, "rows": 2, "deleted": 1}
+    assert stats["windows_truncated"] == 0
+    assert sorted(row["id"] for row in db["time_entries"].rows) == [1, 2, 4, 5]
+    assert db["time_entries"].get(2)["description"] == "Edited"
+    assert db.execute(f"select count(*) from {tags.LINK_TABLE}").fetchone()[0] == 0
+    assert [row["start"] for row in db["time_entries_checkpoints"].rows] == ["2023-01-01", "2023-01-11"]
+
+
+def test_matching_database_writes_nothing(remote):
+    db = sqlite_utils.Database(":memory:")
+    remote.extend([entry(1, 2), entry(2, 14)])
+    save_items([list(remote)], "time_entries", db)
+
+    stats = reconcile_time_entries("token", db, days=10, since=SINCE, client=TogglClient("token", rate_limiter=None))
+
+    assert stats["windows_changed"] == stats["rows"] == stats["deleted"] == 0
+    assert "time_entries_checkpoints" not in db.table_names()
+
+
+def test_cli_reconcile(tmp_path, remote):
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+    save_items([[entry(1, 2), entry(2, 3)]], "time_entries", sqlite_utils.Database(db_file))
+    remote.append(entry(1, 2))
+    args = ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "--rate-limit", "0", "--since", "2023-01-01"]
+
+    result = CliRunner().invoke(cli, [*args, "--reconcile", "--days", "30"])
+
+    assert result.exit_code == 0, result.output
+    assert "🔁 1 of" in result.output and "0 entries saved, 1 deleted" in result.output
+    db = sqlite_utils.Database(db_file)
+    assert [row["id"] for row in db["time_entries"].rows] == [1]
+    assert db["daily_project_totals"].exists()
+
+    result = CliRunner().invoke(cli, [*args, "--reconcile", "--engine", "async"])
+    assert result.exit_code == 2
+
+
+def test_capped_windows_are_split_and_never_delete(remote, monkeypatch):
+    monkeypatch.setattr(utils, "TIME_ENTRIES_RESULT_CAP", 3)
+    db = sqlite_utils.Database(":memory:")
+    saved = [entry(id, 2) for id in range(1, 6)] + [entry(6, 4), entry(7, 5)]
+    save_items([saved], "time_entries", db)
+    # Entry 7 was deleted, but the 2nd alone has more entries than one response holds
+    remote.extend(saved[:-1])
+
+    stats = reconcile_time_entries("token", db, days=10, since=SINCE, client=TogglClient("token", rate_limiter=None))
+
+    assert stats["windows_truncated"] == 1
+    assert stats["deleted"] == 0
+    assert sorted(row["id"] for row in db["time_entries"].rows) == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_capped_window_split_into_complete_days_still_deletes(remote, monkeypatch):
+    monkeypatch.setattr(utils, "TIME_ENTRIES_RESULT_CAP", 3)
+    db = sqlite_utils.Database(":memory:")
+    saved = [entry(1, 2), entry(2, 3), entry(3, 4), entry(4, 5), entry(5, 6)]
+    save_items([saved], "time_entries", db)
+    remote.extend(saved[:-1])
+
+    stats = reconcile_time_entries("token", db, days=10, since=SINCE, client=TogglClient("token", rate_limiter=None))
+
+    assert stats["windows_truncated"] == 0
+    assert stats["deleted"] == 1
+    assert sorted(row["id"] for row in db["time_entries"].rows) == [1, 2, 3, 4]
@@ -0,0 +1,174 @@
+"""Tests for the Reports API v3 fetchers."""
+
+import datetime
+import json
+import threading
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import reports
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL, TogglAPIError, TogglClient
+from toggl_to_sqlite.utils import save_items
+
+REPORTS = "https://api.track.toggl.com/reports/api/v3"
+
+
+def row(id, user_id=5, start="2024-01-02T10:00:00+01:00", **extra):
+    return {
+        "user_id": user_id,
+        "username": f"User {user_id}",
+        "project_id": 7,
+        "task_id": None,
+        "billable": False,
+        "description": f"Entry {id}",
+        "tag_ids": [11],
+        "row_number": id,
+        "time_entries": [{"id": id, "seconds": 3600, "start": start, "stop": None, "at": "2024-01-02T12:00:00+00:00"}],
+        **extra,
+    }
+
+
+def detailed(requests_mock, workspace_id, pages):
+    """Serve ``pages`` of rows for a workspace, following the cursor headers."""
+
+    def search(request, context):
+        first = request.json().get("first_row_number")
+        page = next((index for index, rows in enumerate(pages) if rows[0]["row_number"] == first), 0)
+        if page + 1 < len(pages):
+            following = pages[page + 1][0]
+            context.headers = {
+                "X-Next-ID": str(following["time_entries"][0]["id"]),
+                "X-Next-Row-Number": str(following["row_number"]),
+            }
+        return pages[page]
+
+    requests_mock.get(f"{API_BASE_URL}/workspaces/{workspace_id}/tags", json=[{"id": 11, "name": "dev"}])
+    return requests_mock.post(f"{REPORTS}/workspace/{workspace_id}/search/time_entries", json=search)
+
+
+def test_report_windows():
+    assert reports.report_windows(datetime.date(2023, 1, 1), datetime.date(2024, 6, 1)) == [
+        (datetime.date(2023, 1, 1), datetime.date(2024, 1, 1)),
+        (datetime.date(2024, 1, 2), datetime.date(2024, 6, 1)),
+    ]
+    assert reports.month_windows(datetime.date(2023, 12, 15), datetime.date(2024, 2, 1)) == [
+        (datetime.date(2023, 12, 1), datetime.date(2023, 12, 31)),
+        (datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)),
+        (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)),
+    ]
+
+
+def test_detailed_report_follows_the_cursor(requests_mock):
+    search = detailed(requests_mock, 1, [[row(1), row(2)], [row(3, user_id=6)]])
+    client = TogglClient("token")
+
+    pages = list(reports.get_detailed_pages(client, 1, datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)))
+
+    assert [[entry["id"] for entry in page] for page in pages] == [[1, 2], [3]]
+    assert [request.json() for request in search.request_history] == [
+        {"start_date": "2024-01-01", "end_date": "2024-01-31", "page_size": 50},
+        {"start_date": "2024-01-01", "end_date": "2024-01-31", "page_size": 50, "first_id": 3, "first_row_number": 3},
+    ]
+    assert pages[1][0] == {
+        "id": 3,
+        "workspace_id": 1,
+        "user_id": 6,
+        "username": "User 6",
+        "project_id": 7,
+        "task_id": None,
+        "billable": False,
+        "description": "Entry 3",
+        "tag_ids": [11],
+        "tags": ["dev"],
+        "start": "2024-01-02T09:00:00+00:00",
+        "stop": None,
+        "duration": 3600,
+        "at": "2024-01-02T12:00:00+00:00",
+    }
+
+
+def test_workspaces_are_fetched_in_parallel(requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1}, {"id": 2}])
+    detailed(requests_mock, 1, [[row(1)], [row(2)]])
+    detailed(requests_mock, 2, [[row(3)]])
+    db = sqlite_utils.Database(":memory:")
+
+    pages = reports.get_time_entries("token", datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), concurrency=2)
+    stats = save_items(pages, "time_entries", db)
+
+    assert stats["rows"] == 3
+    assert sorted((entry["id"], entry["workspace_id"]) for entry in db["time_entries"].rows) == [(1, 1), (2, 1), (3, 2)]
+
+
+def test_merge_pages_raises_and_stops_the_other_producers():
+    stopped = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield [{"id": 1}]
+        finally:
+            stopped.set()
+
+    def failing():
+        yield [{"id": 2}]
+        raise TogglAPIError("500 fetching report")
+
+    with pytest.raises(TogglAPIError):
+        for _ in reports.merge_pages([endless, failing], concurrency=2):
+            pass
+    assert stopped.wait(1)
+
+
+def test_cli_reports_engine_and_summary(tmp_path, requests_mock):
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 1, "at": "2024-01-01T00:00:00+00:00"}])
+    detailed(requests_mock, 1, [[row(1), row(2, user_id=6)]])
+    today = datetime.date.today()
+    summary = requests_mock.post(
+        f"{REPORTS}/workspace/1/summary/time_entries",
+        json={"groups": [{"id": 7, "sub_groups": [{"id": 5, "seconds": 3600}, {"id": 6, "seconds": 1800}]}]},
+    )
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+    since = (today - datetime.timedelta(days=10)).isoformat()
+
+    result = CliRunner().invoke(
+        cli,
+        ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "-t", "report_summary"]
+        + ["--engine", "reports", "--rate-limit", "0", "--since", since, "--concurrency", "2"],
+    )
+
+    assert result.exit_code == 0, result.output
+    months = len(reports.month_windows(today - datetime.timedelta(days=10), today))
+    assert "💾 Saved 2 time_entries" in result.output
+    assert f"💾 Saved {2 * months} report_summary" in result.output
+    db = sqlite_utils.Database(db_file)
+    assert sorted(row["user_id"] for row in db["time_entries"].rows) == [5, 6]
+    assert db["daily_project_totals"].count == 1
+    assert summary.call_count == months
+    assert db[reports.SUMMARY_TABLE].count == 2 * months
+
+    result = CliRunner().invoke(cli, ["fetch", db_file, "--auth", str(auth_file), "--engine", "reports", "--adaptive"])
+    assert result.exit_code == 2
+
+
+def test_summary_months_are_replaced_only_once_fetched(requests_mock):
+    db = sqlite_utils.Database(":memory:")
+    old = {"workspace_id": 1, "project_id": 7, "user_id": 5, "seconds": 60}
+    save_items(
+        [[{**old, "id": "a", "month": "2024-01-01"}, {**old, "id": "b", "month": "2024-02-01"}]], reports.SUMMARY_TABLE, db
+    )
+    january = {"groups": [{"id": 8, "sub_groups": [{"id": 5, "seconds": 3600}]}]}
+    requests_mock.post(f"{REPORTS}/workspace/1/summary/time_entries", [{"json": january}, {"status_code": 500, "json": {}}])
+    months = reports.get_summary("token", datetime.date(2024, 1, 1), datetime.date(2024, 2, 29), workspaces=[1])
+
+    with pytest.raises(TogglAPIError):
+        save_items(reports.replace_months(db, months), reports.SUMMARY_TABLE, db)
+
+    # January was replaced; February's request failed, so its old row is kept
+    rows = sorted((row["month"], row["project_id"]) for row in db[reports.SUMMARY_TABLE].rows)
+    assert rows == [("2024-01-01", 8), ("2024-02-01", 7)]
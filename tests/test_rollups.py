@@ -0,0 +1,119 @@
+"""Tests for the incremental rollup tables."""
+
+import datetime
+import json
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite import rollups
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.client import API_BASE_URL
+from toggl_to_sqlite.utils import record_checkpoint
+
+
+def entry(id, start, duration, project_id=1, tags=()):
+    return {"id": id, "start": start, "duration": duration, "workspace_id": 9, "project_id": project_id, "tags": list(tags)}
+
+
+@pytest.fixture
+def db():
+    db = sqlite_utils.Database(":memory:")
+    db["time_entries"].insert_all(
+        [
+            entry(1, "2023-01-02T09:00:00+00:00", 3600, tags=["dev"]),
+            entry(2, "2023-01-02T13:00:00+00:00", 1800, tags=["dev", "review"]),
+            entry(3, "2023-01-03T09:00:00+00:00", 600, project_id=None),
+            entry(4, "2023-01-09T09:00:00+00:00", 900, tags=["dev"]),
+            # Still running
+            entry(5, "2023-01-09T10:00:00+00:00", -1672000000, tags=["dev"]),
+        ],
+        pk="id",
+    )
+    return db
+
+
+def daily(db):
+    return {(r["day"], r["project_id"]): (r["entries"], r["seconds"]) for r in db[rollups.DAILY_TABLE].rows}
+
+
+def weekly(db):
+    return {(r["week"], r["tag"]): (r["entries"], r["seconds"]) for r in db[rollups.WEEKLY_TABLE].rows}
+
+
+def test_first_refresh_builds_everything(db):
+    assert rollups.refresh(db, []) == {rollups.DAILY_TABLE: 3, rollups.WEEKLY_TABLE: 3}
+
+    assert daily(db) == {
+        ("2023-01-02", 1): (2, 5400),
+        ("2023-01-03", None): (1, 600),
+        ("2023-01-09", 1): (1, 900),
+    }
+    assert weekly(db) == {
+        ("2023-01-02", "dev"): (2, 5400),
+        ("2023-01-02", "review"): (1, 1800),
+        ("2023-01-09", "dev"): (1, 900),
+    }
+
+
+def test_only_touched_buckets_are_recomputed(db):
+    rollups.refresh(db)
+    # Change a day inside the refreshed range and one outside it
+    db["time_entries"].update(1, {"duration": 7200})
+    db["time_entries"].update(4, {"duration": 60})
+
+    rollups.refresh(db, [(datetime.date(2023, 1, 2), datetime.date(2023, 1, 2))])
+
+    assert daily(db)[("2023-01-02", 1)] == (2, 9000)
+    assert daily(db)[("2023-01-09", 1)] == (1, 900)
+    assert weekly(db)[("2023-01-02", "dev")] == (2, 9000)
+    assert weekly(db)[("2023-01-09", "dev")] == (1, 900)
+
+
+def test_refresh_is_idempotent_for_overlapping_ranges(db):
+    rollups.refresh(db)
+    before = (daily(db), weekly(db))
+
+    rollups.refresh(
+        db, [(datetime.date(2023, 1, 2), datetime.date(2023, 1, 3)), (datetime.date(2023, 1, 4), datetime.date(2023, 1, 5))]
+    )
+
+    assert (daily(db), weekly(db)) == before
+    assert db[rollups.DAILY_TABLE].count == 3
+
+
+def test_touched_ranges_merges_checkpoints():
+    db = sqlite_utils.Database(":memory:")
+    assert rollups.touched_ranges(db) == []
+    for start, end in (("2023-01-01", "2023-01-11"), ("2023-01-11", "2023-01-21"), ("2023-03-01", "2023-03-11")):
+        record_checkpoint(db, datetime.date.fromisoformat(start), datetime.date.fromisoformat(end), [])
+
+    assert rollups.touched_ranges(db) == [
+        (datetime.date(2023, 1, 1), datetime.date(2023, 1, 21)),
+        (datetime.date(2023, 3, 1), datetime.date(2023, 3, 11)),
+    ]
+
+
+def test_missing_columns_skip_rollups():
+    db = sqlite_utils.Database(":memory:")
+    assert rollups.refresh(db) == {}
+    db["time_entries"].insert({"id": 1, "start": "2023-01-02T09:00:00+00:00", "duration": 60}, pk="id")
+    assert rollups.refresh(db) == {}
+
+
+def test_cli_refreshes_rollups(tmp_path, requests_mock):
+    today = datetime.date.today()
+    requests_mock.get(f"{API_BASE_URL}/workspaces", json=[{"id": 9, "at": "2023-01-01T00:00:00+00:00"}])
+    requests_mock.get(f"{API_BASE_URL}/me/time_entries", json=[entry(1, f"{today}T09:00:00+00:00", 3600, tags=["dev"])])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"api_token": "token"}))
+    db_file = str(tmp_path / "toggl.db")
+
+    result = CliRunner().invoke(cli, ["fetch", db_file, "--auth", str(auth_file), "-t", "time_entries", "--days", "2"])
+
+    assert result.exit_code == 0, result.output
+    assert "📊 Refreshed 1 daily_project_totals rows" in result.output
+    db = sqlite_utils.Database(db_file)
+    assert daily(db) == {(today.isoformat(), 1): (1, 3600)}
+    assert db["time_entries_checkpoints"].count == 0
@@ -120,7 +120,7 @@ def test_get_effective_since_date_fallback_to_workspace(test_db):
     with mock.patch("toggl_to_sqlite.utils.get_start_datetime", return_value=workspace_date) as mock_start:
         result = get_effective_since_date(api_token, table_name, test_db)
         assert result == workspace_date
-        mock_start.assert_called_once_with(api_token)
+        mock_start.assert_called_once_with(api_token, client=None, db=test_db)
 
 
 def test_timezone_handling(test_db):
@@ -0,0 +1,93 @@
+"""Tests for the normalized tag tables."""
+
+import datetime
+
+import sqlite_utils
+
+from toggl_to_sqlite import database, engine, tags
+from toggl_to_sqlite.utils import save_items
+
+API = "https://api.track.toggl.com/api/v9"
+
+
+def entry(id, names, workspace_id=1):
+    return {"id": id, "workspace_id": workspace_id, "tags": list(names), "description": f"Entry {id}"}
+
+
+def tagged(db):
+    sql = """
+    select time_entry_tags.time_entry_id, tags.workspace_id, tags.name from time_entry_tags
+    join tags on tags.id = time_entry_tags.tag_id order by 1, 3
+    """
+    return [tuple(row) for row in db.execute(sql).fetchall()]
+
+
+def test_save_items_links_tags():
+    db = sqlite_utils.Database(":memory:")
+
+    save_items(
+        [[entry(1, ["dev", "review"]), entry(2, [])], [entry(3, ["dev"], workspace_id=2)]],
+        "time_entries",
+        db,
+        normalize_tags=True,
+    )
+
+    assert tagged(db) == [(1, 1, "dev"), (1, 1, "review"), (3, 2, "dev")]
+    assert db["tags"].count == 3
+    assert {index.name for index in db["time_entry_tags"].indexes} >= {"idx_time_entry_tags_tag_id"}
+
+
+def test_resaved_entries_replace_their_links():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[entry(1, ["dev", "review"]), entry(2, ["dev"])]], "time_entries", db, normalize_tags=True)
+
+    save_items([[entry(1, ["meeting"])]], "time_entries", db, batch_size=1, normalize_tags=True)
+    save_items([[entry(2, [])]], "time_entries", db, normalize_tags=True)
+
+    assert tagged(db) == [(1, 1, "meeting")]
+
+
+def test_existing_entries_are_linked_when_enabled():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[entry(1, ["dev"]), entry(2, ["dev", "ops"])]], "time_entries", db)
+    assert "time_entry_tags" not in db.table_names()
+
+    assert tags.ensure_tables(db) is True
+    assert tags.ensure_tables(db) is False
+    assert tagged(db) == [(1, 1, "dev"), (2, 1, "dev"), (2, 1, "ops")]
+
+
+def test_links_are_kept_once_enabled():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[entry(1, ["a"])]], "time_entries", db, normalize_tags=True)
+
+    # A later sync without normalize_tags still updates the links
+    save_items([[entry(1, ["b"])]], "time_entries", db)
+
+    assert tagged(db) == [(1, 1, "b")]
+
+
+def test_unlink():
+    db = sqlite_utils.Database(":memory:")
+    save_items([[entry(1, ["dev"]), entry(2, ["dev"])]], "time_entries", db, normalize_tags=True)
+
+    tags.unlink(db, [1])
+
+    assert tagged(db) == [(2, 1, "dev")]
+
+
+def test_async_engine_links_tags(requests_mock):
+    requests_mock.get(f"{API}/workspaces", json=[])
+    requests_mock.get(f"{API}/me/time_entries", json=[entry(1, ["dev"])])
+    db = database.connect(":memory:")
+
+    engine.fetch(
+        "token",
+        db,
+        types=("time_entries",),
+        days=5,
+        since=datetime.datetime.now() - datetime.timedelta(days=3),
+        normalize_tags=True,
+    )
+
+    assert tagged(db) == [(1, 1, "dev")]
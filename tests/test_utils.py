@@ -12,10 +12,17 @@ from test_classes import (
 )
 
 from toggl_to_sqlite.utils import (
+    MAX_WINDOW_DAYS,
+    WindowSizer,
+    clear_checkpoints,
+    get_adaptive_window_days,
     get_projects,
+    get_resume_date,
     get_start_datetime,
     get_time_entries,
+    get_time_entry_windows,
     get_workspaces,
+    record_checkpoint,
     save_items,
 )
 
@@ -60,12 +67,12 @@ def test_get_time_entries(monkeypatch):
     def mock_get(*args, **kwargs):
         return MockTimeEntryResponse(200)
 
-    def mock_get_start_datetime(api_token=api_token, days=days):
+    def mock_get_start_datetime(api_token=api_token, since=None, client=None, db=None):
         return datetime.date(2022, 1, 1)
 
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", mock_get_start_datetime)
-    actual = get_time_entries(api_token=api_token, days=days)
+    actual = list(get_time_entries(api_token=api_token, days=days))
     expected = [
         [
             {
@@ -121,10 +128,10 @@ def test_get_projects(monkeypatch):
     def mock_get(*args, **kwargs):
         return MockResponseWorkspaces(200)
 
-    def mock_get_workspaces(api_token=api_token):
+    def mock_get_workspaces(api_token=api_token, client=None):
         return [[{"id": 1806100}]]
 
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     monkeypatch.setattr("toggl_to_sqlite.utils.get_workspaces", mock_get_workspaces)
     expected = [
         [
@@ -148,7 +155,7 @@ def test_get_projects(monkeypatch):
             }
         ]
     ]
-    actual = get_projects(api_token=api_token)
+    actual = list(get_projects(api_token=api_token))
     assert actual == expected
 
 
@@ -157,8 +164,8 @@ def test_get_workspaces(monkeypatch):
         return MockResponseWorkspaces(200)
 
     api_token = "fake_api"
-    monkeypatch.setattr(requests, "get", mock_get)
-    actual = get_workspaces(api_token=api_token)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
+    actual = list(get_workspaces(api_token=api_token))
     assert "api_token" not in actual[0][0].keys()
 
 
@@ -167,7 +174,7 @@ def test_get_start_datetime_no_since_passed_with_response(monkeypatch):
         return MockResponseGetStartDateTime(200)
 
     api_token = "fake_api"
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     expected = datetime.date(2019, 12, 4)
     actual = get_start_datetime(api_token=api_token)
     assert actual == expected
@@ -178,7 +185,7 @@ def test_get_start_datetime_no_since_passed_with_no_response(monkeypatch):
         return MockResponseGetStartDateTime(404)
 
     api_token = "fake_api"
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     expected = datetime.date.today()
     actual = get_start_datetime(api_token=api_token)
     assert actual == expected
@@ -190,7 +197,7 @@ def test_get_start_datetime_since_passed_with_response(monkeypatch):
 
     api_token = "fake_api"
     since = datetime.datetime(2020, 3, 13)
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     expected = datetime.date(2020, 3, 13)
     actual = get_start_datetime(api_token=api_token, since=since)
     assert actual == expected
@@ -202,7 +209,7 @@ def test_get_start_datetime_since_passed_with_no_response(monkeypatch):
 
     api_token = "fake_api"
     since = datetime.datetime.now()
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(requests.Session, "get", mock_get)
     expected = datetime.date.today()
     actual = get_start_datetime(api_token=api_token, since=since)
     assert actual == expected
@@ -221,3 +228,157 @@ def test_save_items_with_attribute_error(capsys):
     # Check that the exception was caught and item was printed
     captured = capsys.readouterr()
     assert "not_a_dict" in captured.out
+
+
+def test_get_time_entry_windows():
+    today = datetime.date.today()
+    windows = get_time_entry_windows(today - datetime.timedelta(days=25), 10)
+    assert len(windows) == 3
+    assert windows[0][0] == (today - datetime.timedelta(days=25)).strftime("%Y-%m-%dT00:00:00-00:00")
+    assert windows[0][1] == windows[1][0]
+    assert get_time_entry_windows(today, 0) == []
+
+
+def test_get_time_entries_concurrent_keeps_chronological_order(requests_mock, monkeypatch):
+    start = datetime.date.today() - datetime.timedelta(days=40)
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", lambda *args, **kwargs: start)
+
+    def respond(request, context):
+        return [{"id": request.qs["start_date"][0]}]
+
+    requests_mock.get("https://api.track.toggl.com/api/v9/me/time_entries", json=respond)
+    actual = list(get_time_entries(api_token="fake_api", days=5, concurrency=4))
+
+    starts = [window[0]["id"] for window in actual]
+    assert len(starts) == 8
+    assert starts == sorted(starts)
+
+
+def test_get_time_entries_is_streamed(requests_mock, monkeypatch):
+    start = datetime.date.today() - datetime.timedelta(days=40)
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", lambda *args, **kwargs: start)
+    requests_mock.get("https://api.track.toggl.com/api/v9/me/time_entries", json=[{"id": 1}])
+
+    entries = get_time_entries(api_token="fake_api", days=5)
+    assert requests_mock.call_count == 0
+
+    next(entries)
+    assert requests_mock.call_count == 1
+
+
+def test_save_items_consumes_pages_incrementally():
+    db = sqlite_utils.Database(":memory:")
+    saved_before_each_page = []
+
+    def pages():
+        for page in range(3):
+            saved_before_each_page.append(db["time_entries"].count if db["time_entries"].exists() else 0)
+            yield [{"id": page * 10 + i} for i in range(10)]
+
+    save_items(pages(), "time_entries", db)
+
+    assert saved_before_each_page == [0, 10, 20]
+    assert db["time_entries"].count == 30
+
+
+def mock_entries_per_day(requests_mock):
+    """Respond with one time entry for every day in the requested window."""
+
+    def respond(request, context):
+        start = datetime.date.fromisoformat(request.qs["start_date"][0][:10])
+        end = datetime.date.fromisoformat(request.qs["end_date"][0][:10])
+        return [{"id": (start + datetime.timedelta(days=n)).toordinal()} for n in range((end - start).days)]
+
+    requests_mock.get("https://api.track.toggl.com/api/v9/me/time_entries", json=respond)
+
+
+def test_window_sizer_grows_and_shrinks():
+    sizer = WindowSizer(10)
+    assert sizer.observe(10, 0) == 20
+    assert sizer.observe(20, 500) == 20
+    assert sizer.observe(20, 990) == 10
+    assert sizer.observe(1, 5000) == 1
+    assert WindowSizer(1000).days == MAX_WINDOW_DAYS
+
+
+def test_adaptive_time_entries_grow_in_quiet_periods(requests_mock, monkeypatch):
+    start = datetime.date.today() - datetime.timedelta(days=40)
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", lambda *args, **kwargs: start)
+    requests_mock.get("https://api.track.toggl.com/api/v9/me/time_entries", json=[])
+    db = sqlite_utils.Database(":memory:")
+
+    list(get_time_entries(api_token="fake_api", days=2, adaptive=True, db=db))
+
+    windows = list(db["time_entries_windows"].rows)
+    assert [window["days"] for window in windows][:4] == [2, 4, 8, 16]
+    assert windows[0]["start"] == start.isoformat()
+    assert windows[-1]["end"] == (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    assert get_adaptive_window_days(db) == 32
+
+
+def test_adaptive_time_entries_split_full_windows(requests_mock, monkeypatch):
+    start = datetime.date.today() - datetime.timedelta(days=20)
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", lambda *args, **kwargs: start)
+    monkeypatch.setattr("toggl_to_sqlite.utils.TIME_ENTRIES_RESULT_CAP", 4)
+    mock_entries_per_day(requests_mock)
+    db = sqlite_utils.Database(":memory:")
+    db["time_entries_windows"].insert({"start": "2000-01-01", "next_days": 10}, pk="start")
+
+    windows = list(get_time_entries(api_token="fake_api", days=25, adaptive=True, db=db, concurrency=2))
+
+    ids = [entry["id"] for window in windows for entry in window]
+    assert ids == sorted(set(ids))
+    assert len(ids) == 21
+    # The recorded size of 10 days was used for the first window, then shrunk
+    first = db["time_entries_windows"].get(start.isoformat())
+    assert first["days"] == 10
+    assert first["next_days"] < 10
+
+
+def crash_after(pages, count):
+    for n, page in enumerate(pages):
+        if n == count:
+            raise RuntimeError("crash")
+        yield page
+
+
+def test_interrupted_sync_resumes_from_first_incomplete_window(requests_mock, monkeypatch):
+    start = datetime.date.today() - datetime.timedelta(days=40)
+    monkeypatch.setattr("toggl_to_sqlite.utils.get_start_datetime", lambda *args, **kwargs: start)
+    mock_entries_per_day(requests_mock)
+    db = sqlite_utils.Database(":memory:")
+
+    entries = get_time_entries(api_token="fake_api", days=10, db=db)
+    with pytest.raises(RuntimeError):
+        save_items(crash_after(entries, 2), "time_entries", db)
+
+    checkpoints = list(db["time_entries_checkpoints"].rows)
+    assert [(row["start"], row["rows"]) for row in checkpoints] == [
+        (start.isoformat(), 10),
+        ((start + datetime.timedelta(days=10)).isoformat(), 10),
+    ]
+    assert get_resume_date(db, start) == start + datetime.timedelta(days=20)
+
+    requests_mock.reset_mock()
+    list(get_time_entries(api_token="fake_api", days=10, db=db))
+    assert requests_mock.call_count == 2
+    assert requests_mock.request_history[0].qs["start_date"][0][:10] == (start + datetime.timedelta(days=20)).isoformat()
+
+
+def test_resume_date_stops_at_first_gap():
+    db = sqlite_utils.Database(":memory:")
+    start = datetime.date(2023, 1, 1)
+    record_checkpoint(db, start, datetime.date(2023, 1, 11), [])
+    record_checkpoint(db, datetime.date(2023, 1, 21), datetime.date(2023, 1, 31), [])
+
+    assert get_resume_date(db, start) == datetime.date(2023, 1, 11)
+    assert get_resume_date(db, datetime.date(2022, 12, 1)) == datetime.date(2022, 12, 1)
+
+    clear_checkpoints(db)
+    assert get_resume_date(db, start) == start
+
+
+def test_get_start_datetime_accepts_a_date(monkeypatch):
+    monkeypatch.setattr(requests.Session, "get", lambda *args, **kwargs: MockResponseGetStartDateTime(200))
+
+    assert get_start_datetime(api_token="fake_api", since=datetime.date(2023, 1, 1)) == datetime.date(2023, 1, 1)
@@ -0,0 +1,128 @@
+"""Tests for the bulk writer used by save_items."""
+
+import pytest
+import sqlite_utils
+from click.testing import CliRunner
+
+from toggl_to_sqlite.cli import cli
+from toggl_to_sqlite.utils import save_items
+from toggl_to_sqlite.writer import BulkWriter
+
+
+@pytest.fixture
+def db(tmp_path):
+    return sqlite_utils.Database(tmp_path / "writer.db")
+
+
+def test_whole_run_is_one_transaction(db):
+    writer = BulkWriter(db, "time_entries")
+    writer.write([{"id": 1, "description": "one"}])
+    writer.write([{"id": 2, "description": "two"}])
+    assert db.conn.in_transaction
+
+    stats = writer.close()
+
+    assert not db.conn.in_transaction
+    assert stats["rows"] == 2
+    assert stats["rows_per_second"] > 0
+    assert db["time_entries"].count == 2
+
+
+def test_commits_every_batch_size_rows(db, monkeypatch):
+    writer = BulkWriter(db, "time_entries", batch_size=2)
+    commits = []
+    original_commit = writer.commit
+
+    def commit():
+        commits.append(writer.uncommitted)
+        original_commit()
+
+    monkeypatch.setattr(writer, "commit", commit)
+    writer.write([{"id": i} for i in range(5)])
+    writer.close()
+
+    assert commits == [2, 2, 1]
+    assert db["time_entries"].count == 5
+
+
+def test_schema_read_once_and_new_columns_added(db):
+    db["time_entries"].insert({"id": 1, "description": "existing"}, pk="id")
+    writer = BulkWriter(db, "time_entries")
+    writer.write([{"id": 2, "description": "two"}])
+    writer.write([{"id": 3, "tags": ["a", "b"], "billable": True}])
+    writer.close()
+
+    assert db["time_entries"].columns_dict == {"id": int, "description": str, "billable": int, "tags": str}
+    assert db["time_entries"].get(3)["tags"] == '["a", "b"]'
+
+
+def test_upserts_replace_existing_rows(db):
+    save_items([[{"id": 1, "description": "old"}]], "time_entries", db)
+    save_items([[{"id": 1, "description": "new"}]], "time_entries", db)
+
+    assert list(db["time_entries"].rows) == [{"id": 1, "description": "new"}]
+
+
+def test_save_items_shares_a_writer(db):
+    writer = BulkWriter(db, "projects")
+    save_items([[{"id": 1}]], "projects", db, writer=writer)
+    stats = save_items([[{"id": 2}], []], "projects", db, writer=writer)
+
+    assert stats["rows"] == 2
+    assert db.conn.in_transaction
+    writer.close()
+    assert db["projects"].count == 2
+
+
+def test_rows_with_unchanged_at_are_skipped(db):
+    save_items([[{"id": 1, "at": "2023-01-01", "description": "one"}, {"id": 2, "at": "2023-01-01"}]], "time_entries", db)
+    written = []
+    writer = BulkWriter(db, "time_entries", on_write=written.extend)
+
+    writer.write(
+        [{"id": 1, "at": "2023-01-01", "description": "ignored"}, {"id": 2, "at": "2023-02-01"}, {"id": 3, "at": "2023-02-01"}]
+    )
+    stats = writer.close()
+
+    assert [row["id"] for row in written] == [2, 3]
+    assert (stats["rows"], stats["written"], stats["skipped"]) == (3, 2, 1)
+    assert db["time_entries"].get(1)["description"] == "one"
+
+
+def test_rows_without_at_are_compared_by_content(db):
+    rows = [{"id": 1, "name": "One", "active": True, "tags": ["a"]}, {"id": 2, "name": "Two", "active": False, "tags": []}]
+    save_items([rows], "projects", db)
+
+    stats = save_items([[dict(rows[0]), dict(rows[1], name="Renamed")]], "projects", db)
+
+    assert (stats["written"], stats["skipped"]) == (1, 1)
+    assert db["projects"].get(2)["name"] == "Renamed"
+
+
+def test_rows_filling_a_new_column_are_written(db):
+    save_items([[{"id": 1, "at": "2023-01-01"}, {"id": 2, "at": "2023-01-01"}]], "time_entries", db)
+
+    stats = save_items([[{"id": 1, "at": "2023-01-01"}], [{"id": 2, "at": "2023-01-01", "tag_ids": [1]}]], "time_entries", db)
+
+    assert (stats["written"], stats["skipped"]) == (1, 1)
+    assert db["time_entries"].get(2)["tag_ids"] == "[1]"
+
+
+def test_skip_unchanged_can_be_disabled(db):
+    save_items([[{"id": 1, "at": "2023-01-01"}]], "time_entries", db)
+
+    assert save_items([[{"id": 1, "at": "2023-01-01"}]], "time_entries", db)["skipped"] == 1
+    assert save_items([[{"id": 1, "at": "2023-01-01"}]], "time_entries", db, skip_unchanged=False)["written"] == 1
+
+
+def test_cli_reports_written_and_unchanged(tmp_path, requests_mock):
+    requests_mock.get("https://api.track.toggl.com/api/v9/workspaces", json=[{"id": 1, "at": "2023-01-01T00:00:00+00:00"}])
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text('{"api_token": "token"}')
+    args = ["fetch", str(tmp_path / "t.db"), "--auth", str(auth_file), "-t", "workspaces", "--rate-limit", "0"]
+
+    assert "💾 Saved 1 workspaces: 1 written, 0 unchanged" in CliRunner().invoke(cli, args).output
+    # Without validators the response is saved again, but the row matches what is stored
+    sqlite_utils.Database(tmp_path / "t.db")["_http_cache"].drop()
+    assert "💾 Saved 1 workspaces: 0 written, 1 unchanged" in CliRunner().invoke(cli, args).output
+    assert "💾 Saved 1 workspaces: 1 written, 0 unchanged" in CliRunner().invoke(cli, [*args, "--force-full"]).output